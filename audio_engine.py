@@ -0,0 +1,181 @@
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+
+import numpy as np
+
+import media_cache
+from ffmpeg_utils import run_ffmpeg
+
+# ------------------------------------------------
+# Audio preprocessing
+# ------------------------------------------------
+# Previews are decoded once into a float32 buffer; trimming, looping, fades
+# and loudness are array operations, and the result is encoded to AAC once
+# per track and settings, then muxed into the video as-is.
+SAMPLE_RATE = 44100
+CHANNELS = 2
+TARGET_RMS_DBFS = -16.0
+PEAK_CEILING = 10 ** (-1.0 / 20)  # -1 dBFS
+FADE_IN = 0.05
+FADE_OUT = 1.0
+
+# Bump when the processing below changes so cached AAC files are rebuilt
+AUDIO_PIPELINE_VERSION = 1
+
+# Hook detection works on ~23ms frames; results are kept per track forever,
+# one row per track so concurrent jobs never overwrite each other's hooks
+HOOK_FRAME = 1024
+HOOKS_DB = os.getenv("HOOKS_DB", "hooks.db")
+# Hooks saved before the database existed, imported on first use
+HOOKS_FILE = os.getenv("HOOKS_FILE", "hooks.json")
+
+
+def decode(source):
+    """Decode a file path or in-memory bytes to an (n, CHANNELS) float32 array."""
+    in_memory = isinstance(source, (bytes, bytearray))
+    raw = run_ffmpeg([
+        "-i", "pipe:0" if in_memory else source,
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE),
+        "-",
+    ], input=bytes(source) if in_memory else None)
+    return np.frombuffer(raw, dtype=np.float32).reshape(-1, CHANNELS)
+
+
+def trim_loop(samples, start, duration):
+    """Take `duration` seconds from `start`, looping the buffer if it runs short."""
+    begin = int(start * SAMPLE_RATE)
+    length = int(duration * SAMPLE_RATE)
+    if len(samples) == 0:
+        raise ValueError("Cannot trim an empty audio buffer.")
+    begin = min(begin, len(samples) - 1)
+    if begin + length <= len(samples):
+        return samples[begin:begin + length]
+    repeats = -(-(begin + length) // len(samples))
+    return np.tile(samples, (repeats, 1))[begin:begin + length]
+
+
+def apply_fades(samples, fade_in=FADE_IN, fade_out=FADE_OUT):
+    out = samples.copy()
+    n_in = min(int(fade_in * SAMPLE_RATE), len(out))
+    n_out = min(int(fade_out * SAMPLE_RATE), len(out))
+    if n_in:
+        out[:n_in] *= np.linspace(0.0, 1.0, n_in, dtype=np.float32)[:, None]
+    if n_out:
+        out[-n_out:] *= np.linspace(1.0, 0.0, n_out, dtype=np.float32)[:, None]
+    return out
+
+
+def normalize_loudness(samples, target_dbfs=TARGET_RMS_DBFS):
+    """Scale to a target RMS level without letting peaks exceed PEAK_CEILING."""
+    rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+    if rms == 0.0:
+        return samples
+    gain = 10 ** (target_dbfs / 20) / rms
+    peak = float(np.max(np.abs(samples)))
+    gain = min(gain, PEAK_CEILING / peak)
+    return (samples * gain).astype(np.float32)
+
+
+def find_hook_start(samples, duration=15):
+    """Start time (seconds) of the `duration`-second window with the most energy and onsets."""
+    window = int(duration * SAMPLE_RATE) // HOOK_FRAME
+    n_frames = len(samples) // HOOK_FRAME
+    if n_frames <= window:
+        return 0.0
+
+    mono = samples[:n_frames * HOOK_FRAME].mean(axis=1)
+    frames = mono.reshape(n_frames, HOOK_FRAME)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+
+    # Onset strength: rises in log-energy from one frame to the next
+    log_rms = np.log(rms + 1e-6)
+    onset = np.maximum(np.diff(log_rms, prepend=log_rms[0]), 0.0)
+
+    score = rms / (rms.mean() or 1.0) + onset / (onset.mean() or 1.0)
+    csum = np.concatenate(([0.0], np.cumsum(score)))
+    window_scores = csum[window:] - csum[:-window]
+    best = int(np.argmax(window_scores))
+    return best * HOOK_FRAME / SAMPLE_RATE
+
+
+def open_hooks():
+    conn = sqlite3.connect(HOOKS_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("CREATE TABLE IF NOT EXISTS hooks (hook_key TEXT PRIMARY KEY, start REAL NOT NULL)")
+    if os.path.isfile(HOOKS_FILE) and not conn.execute("SELECT 1 FROM hooks LIMIT 1").fetchone():
+        with open(HOOKS_FILE, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        conn.executemany("INSERT OR IGNORE INTO hooks (hook_key, start) VALUES (?, ?)", legacy.items())
+        print(f"📦 Imported {len(legacy)} hooks into {HOOKS_DB}")
+    return conn
+
+
+def load_hook(hook_key):
+    with closing(open_hooks()) as conn:
+        row = conn.execute("SELECT start FROM hooks WHERE hook_key = ?", (hook_key,)).fetchone()
+    return row[0] if row else None
+
+
+def save_hook(hook_key, start):
+    with closing(open_hooks()) as conn:
+        conn.execute("INSERT OR REPLACE INTO hooks (hook_key, start) VALUES (?, ?)", (hook_key, start))
+
+
+def encode_aac(samples, output_path, bitrate="128k"):
+    run_ffmpeg([
+        "-f", "f32le", "-ar", str(SAMPLE_RATE), "-ac", str(CHANNELS), "-i", "-",
+        "-c:a", "aac", "-b:a", bitrate,
+        output_path,
+    ], input=np.ascontiguousarray(samples, dtype=np.float32).tobytes())
+    return output_path
+
+
+def prepare_audio(audio, duration=15, start=None, bitrate="128k", workdir=None):
+    """Return the path of a cached AAC clip of `duration` seconds from `audio`.
+
+    `audio` is a file path or the encoded preview bytes. With no `start`,
+    the clip begins at the track's detected hook.
+    """
+    if isinstance(audio, (bytes, bytearray)):
+        source = media_cache.hash_bytes(audio)
+    else:
+        source = media_cache.hash_file(audio)
+    samples = None
+    if start is None:
+        hook_key = f"{source}:{duration}"
+        start = load_hook(hook_key)
+        if start is None:
+            samples = decode(audio)
+            start = find_hook_start(samples, duration)
+            save_hook(hook_key, start)
+            print(f"🎯 Detected hook at {start:.2f}s")
+
+    key = media_cache.render_key(
+        stage="audio",
+        version=AUDIO_PIPELINE_VERSION,
+        source=source,
+        start=round(start, 3),
+        duration=duration,
+        bitrate=bitrate,
+    )
+    cached = media_cache.lookup(key, ".m4a")
+    if cached:
+        return cached
+
+    if samples is None:
+        samples = decode(audio)
+    samples = trim_loop(samples, start, duration)
+    samples = normalize_loudness(apply_fades(samples))
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".m4a", dir=workdir)
+    os.close(fd)
+    try:
+        encode_aac(samples, tmp_path, bitrate)
+        return media_cache.store(key, tmp_path, ".m4a")
+    finally:
+        os.remove(tmp_path)
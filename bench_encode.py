@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark the lyric video encode profiles.
+#
+#   python bench_encode.py                      # synthetic card + tone
+#   python bench_encode.py --image card.png --audio preview.mp3 --runs 3
+#   python bench_encode.py --animate 4           # also time a 4-line reveal
+
+import argparse
+import io
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Keep the bench's audio cache out of the real media cache
+os.environ.setdefault("MEDIA_CACHE_DIR", tempfile.mkdtemp(prefix="bench-cache-"))
+os.environ.setdefault("HOOKS_DB", os.path.join(os.environ["MEDIA_CACHE_DIR"], "hooks.db"))
+
+from audio_engine import prepare_audio  # noqa: E402
+from encoding import ENCODE_PROFILES, get_encode_profile  # noqa: E402
+from lyric_animation import reveal_keyframes  # noqa: E402
+from video_render import encode_keyframes, render_still_video  # noqa: E402
+
+VIDEO_SIZE = (1280, 720)
+SAMPLE_RATE = 44100
+
+
+def synthetic_card(path):
+    img = Image.new("RGB", VIDEO_SIZE, color="black")
+    draw = ImageDraw.Draw(img)
+    draw.text((640, 50), "Benchmark Song", fill="white", anchor="mm")
+    draw.multiline_text((640, 350), "a line of lyrics\nanother line of lyrics", fill="white", anchor="mm", align="center")
+    img.save(path)
+    return path
+
+
+def synthetic_preview(seconds=30):
+    """A 440 Hz tone as WAV bytes, standing in for a downloaded preview."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    tone = 0.2 * np.sin(2 * np.pi * 440 * t)
+    pcm = (np.stack([tone, tone], axis=-1) * 32767).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def synthetic_reveal(lines, duration):
+    base = Image.new("RGBA", VIDEO_SIZE, color="black")
+    ImageDraw.Draw(base).text((640, 50), "Benchmark Song", fill="white", anchor="mm")
+    layers = []
+    for i in range(lines):
+        layer = Image.new("RGBA", VIDEO_SIZE, (0, 0, 0, 0))
+        ImageDraw.Draw(layer).text((640, 250 + 60 * i), f"lyric line {i + 1}", fill="white", anchor="mm")
+        layers.append(layer)
+    return reveal_keyframes(base, layers, duration)
+
+
+def encode_animated_once(keyframes, output_path, profile, duration):
+    # Video only: the animated path muxes pre-encoded audio, which costs the same either way
+    start = time.perf_counter()
+    encode_keyframes(keyframes, output_path, duration, profile, VIDEO_SIZE)
+    elapsed = time.perf_counter() - start
+    return elapsed, os.path.getsize(output_path)
+
+
+def warm_audio(audio, profile, duration, workdir):
+    # The bots encode a track's audio once and reuse it from the cache, so the
+    # timed renders should only pay for the video encode and the mux
+    prepare_audio(audio, duration, bitrate=get_encode_profile(profile)["audio_bitrate"], workdir=workdir)
+
+
+def encode_once(image_path, audio, output_path, profile, duration):
+    start = time.perf_counter()
+    render_still_video(image_path, audio, output_path, duration, profile, size=VIDEO_SIZE, logger=None)
+    elapsed = time.perf_counter() - start
+    return elapsed, os.path.getsize(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lyric video encode profiles.")
+    parser.add_argument("--image", help="Card image to encode (default: synthetic card)")
+    parser.add_argument("--audio", help="Audio file to mux (default: synthetic tone)")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--profiles", nargs="+", choices=sorted(ENCODE_PROFILES), default=list(ENCODE_PROFILES))
+    parser.add_argument("--animate", type=int, default=0, metavar="LINES",
+                        help="Also time a line-by-line reveal with this many lines")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = args.image or synthetic_card(os.path.join(tmp, "card.png"))
+        audio = args.audio or synthetic_preview()
+        print(f"{'profile':<10} {'wall (s)':>10} {'size (KiB)':>12}")
+        for name in args.profiles:
+            output_path = os.path.join(tmp, f"{name}.mp4")
+            warm_audio(audio, name, args.duration, tmp)
+            timings = []
+            for _ in range(args.runs):
+                elapsed, size = encode_once(image_path, audio, output_path, name, args.duration)
+                timings.append(elapsed)
+            print(f"{name:<10} {min(timings):>10.2f} {size / 1024:>12.1f}")
+            if args.animate:
+                keyframes = synthetic_reveal(args.animate, args.duration)
+                timings = []
+                for _ in range(args.runs):
+                    elapsed, size = encode_animated_once(keyframes, os.path.join(tmp, f"{name}-animated.mp4"),
+                                                         name, args.duration)
+                    timings.append(elapsed)
+                print(f"{name + '+anim':<10} {min(timings):>10.2f} {size / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
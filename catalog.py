@@ -0,0 +1,225 @@
+import copy
+import functools
+import json
+import math
+import os
+import random
+import re
+import time
+
+import requests
+
+from title_index import TitleIndex, normalize
+
+# ------------------------------------------------
+# Local track catalogs
+# ------------------------------------------------
+# One JSON file per source and artist holds the whole discography with the
+# fields the bots select on. It is refreshed incrementally when it is older
+# than CATALOG_MAX_AGE, so a normal run picks a song without any network call.
+CATALOG_DIR = os.getenv("CATALOG_DIR", "catalog")
+CATALOG_MAX_AGE = 7 * 24 * 60 * 60
+
+LASTFM_URL = "http://ws.audioscrobbler.com/2.0/"
+
+
+def catalog_path(source, artist):
+    slug = re.sub(r'[^a-z0-9]+', '_', artist.lower()).strip('_')
+    return os.path.join(CATALOG_DIR, f"{source}_{slug}.json")
+
+
+def load_catalog(source, artist):
+    path = catalog_path(source, artist)
+    if not os.path.isfile(path):
+        return {"refreshed_at": 0, "tracks": {}, "albums": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_catalog(source, artist, catalog):
+    path = catalog_path(source, artist)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+# ------------------------------------------------
+# Spotify
+# ------------------------------------------------
+def _spotify_pages(sp, page):
+    while page:
+        yield from page["items"]
+        page = sp.next(page) if page.get("next") else None
+
+
+def sync_spotify_catalog(sp, artist, catalog):
+    """Walk every album of the artist; only albums not seen before are listed track by track."""
+    found = sp.search(q=f'artist:"{artist}"', type="artist", limit=1)["artists"]["items"]
+    if not found:
+        raise Exception(f"Artist '{artist}' not found on Spotify.")
+    artist_id = found[0]["id"]
+
+    known_albums = set(catalog.get("albums", []))
+    albums = _spotify_pages(sp, sp.artist_albums(artist_id, include_groups="album,single,compilation", limit=50))
+    new_albums = [a["id"] for a in albums if a["id"] not in known_albums]
+
+    track_ids = set(catalog["tracks"])
+    for album_id in new_albums:
+        for track in _spotify_pages(sp, sp.album_tracks(album_id, limit=50)):
+            if any(a["id"] == artist_id for a in track["artists"]):
+                track_ids.add(track["id"])
+
+    # Popularity drifts, so every known track is re-read (50 per request)
+    track_ids = sorted(track_ids)
+    for i in range(0, len(track_ids), 50):
+        for track in sp.tracks(track_ids[i:i + 50])["tracks"]:
+            if not track:
+                continue
+            catalog["tracks"][track["id"]] = {
+                "name": track["name"],
+                "popularity": track.get("popularity", 0),
+                "isrc": track.get("external_ids", {}).get("isrc"),
+                "album": track["album"]["name"],
+            }
+    catalog["albums"] = sorted(known_albums | set(new_albums))
+    print(f"📀 Spotify catalog for {artist}: {len(catalog['tracks'])} tracks ({len(new_albums)} new albums)")
+    return catalog
+
+
+# ------------------------------------------------
+# Last.fm
+# ------------------------------------------------
+def sync_lastfm_catalog(api_key, artist, catalog):
+    page, total_pages = 1, 1
+    while page <= total_pages:
+        response = requests.get(LASTFM_URL, params={
+            "method": "artist.gettoptracks",
+            "artist": artist,
+            "api_key": api_key,
+            "format": "json",
+            "limit": 1000,
+            "page": page,
+        }, timeout=10)
+        response.raise_for_status()
+        toptracks = response.json().get("toptracks", {})
+        total_pages = int(toptracks.get("@attr", {}).get("totalPages", 1))
+        for track in toptracks.get("track", []):
+            track_id = track.get("mbid") or track["name"].lower()
+            catalog["tracks"][track_id] = {
+                "name": track["name"],
+                "playcount": int(track.get("playcount", 0)),
+                "isrc": None,
+                "album": None,
+            }
+        page += 1
+    print(f"📀 Last.fm catalog for {artist}: {len(catalog['tracks'])} tracks")
+    return catalog
+
+
+def get_catalog(source, artist, sync, max_age=CATALOG_MAX_AGE, deadline=None):
+    """Return the local catalog, refreshing it through `sync(catalog)` when stale.
+
+    With a deadline, refreshing an existing catalog runs under the "catalog"
+    stage budget and the cached copy is used if it overruns; a first sync
+    has nothing to fall back on and always runs to completion.
+    """
+    catalog = load_catalog(source, artist)
+    if time.time() - catalog["refreshed_at"] > max_age or not catalog["tracks"]:
+        try:
+            # Sync a copy, so an abandoned sync never touches the catalog in use
+            fresh = copy.deepcopy(catalog)
+            if deadline and catalog["tracks"]:
+                fresh = deadline.run("catalog", sync, fresh)
+            else:
+                fresh = sync(fresh)
+            fresh["refreshed_at"] = time.time()
+            save_catalog(source, artist, fresh)
+            catalog = fresh
+        except Exception as e:
+            if not catalog["tracks"]:
+                raise
+            print(f"⚠️ Catalog refresh failed, using cached catalog: {e}")
+    return catalog
+
+
+# ------------------------------------------------
+# Weighted selection
+# ------------------------------------------------
+class AliasTable:
+    """Walker/Vose alias table: O(n) to build, O(1) per weighted draw."""
+
+    def __init__(self, items, weights):
+        n = len(items)
+        if n == 0:
+            raise ValueError("Cannot build an alias table with no items.")
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        self.items = list(items)
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng=random):
+        i = rng.randrange(len(self.items))
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+
+
+_tables = {}
+
+
+def unique_recordings(tracks, weight):
+    """One track per song, keeping the highest-weighted copy.
+
+    The same recording sits on the studio album, anniversary editions and
+    every compilation, each with its own track ID. Copies share an ISRC, and
+    release variants share a canonical title; counting each copy would draw
+    anthologized songs several times more often than their popularity says.
+    """
+    by_isrc = {}
+    for track in tracks:
+        isrc = track.get("isrc")
+        key = isrc or id(track)
+        if key not in by_isrc or weight(track) > weight(by_isrc[key]):
+            by_isrc[key] = track
+    by_title = {}
+    for track in by_isrc.values():
+        key = normalize(track["name"]) or id(track)
+        if key not in by_title or weight(track) > weight(by_title[key]):
+            by_title[key] = track
+    return list(by_title.values())
+
+
+def weighted_choice(source, catalog, weight):
+    """Draw a track from `catalog`, weighted by `weight(track)`; the table is built once per refresh."""
+    table_key = (source, catalog["refreshed_at"])
+    if table_key not in _tables:
+        tracks = unique_recordings(catalog["tracks"].values(), weight)
+        _tables[table_key] = AliasTable(tracks, [weight(t) for t in tracks])
+    return _tables[table_key].sample()
+
+
+def spotify_weight(track):
+    # +1 so tracks Spotify rates 0 can still come up
+    return track.get("popularity", 0) + 1
+
+
+def lastfm_weight(track):
+    # Square root keeps the biggest hits from drowning out deep cuts
+    return math.sqrt(track.get("playcount", 0)) + 1
+
+
+@functools.lru_cache(maxsize=None)
+def title_index(source, artist):
+    """Canonical-title index over the local catalog (built once per process)."""
+    return TitleIndex(track["name"] for track in load_catalog(source, artist)["tracks"].values())
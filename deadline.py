@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+# ------------------------------------------------
+# Posting deadlines
+# ------------------------------------------------
+# A post has an overall deadline, and each stage gets its own budget that is
+# never more than what is left overall. A stage that overruns raises
+# StageTimeout so the caller can fall back to something cheaper (an
+# image-only tweet, a cached snippet, the card without artwork) instead of
+# missing the slot.
+POST_DEADLINE = int(os.getenv("POST_DEADLINE", str(15 * 60)))
+
+# Seconds per stage; anything not listed may use whatever time is left
+STAGE_BUDGETS = {
+    "catalog": 60,
+    "lyrics": 30,
+    "artwork": 20,
+    "audio": 30,
+    "render": 240,
+    "upload": 180,
+    "processing": 180,
+    "tweet": 120,
+}
+
+# Held back from the regular stages so the fallback post still has time to go out
+FALLBACK_RESERVE = 120
+
+
+class StageTimeout(Exception):
+    def __init__(self, stage, budget):
+        super().__init__(f"Stage '{stage}' exceeded its {budget:.1f}s budget")
+        self.stage = stage
+        self.budget = budget
+
+
+class Deadline:
+    def __init__(self, total, budgets=None, reserve=0):
+        self.expires_at = time.monotonic() + total
+        self.budgets = dict(budgets or {})
+        self.reserve = reserve
+        self.overruns = []
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self, fallback=False):
+        return self.budget(None, fallback) <= 0
+
+    def budget(self, stage, fallback=False):
+        """Seconds `stage` may take: its own budget, capped by the overall deadline.
+
+        Regular stages cannot touch the reserve; fallback stages can.
+        """
+        available = self.remaining() if fallback else max(0.0, self.remaining() - self.reserve)
+        return min(self.budgets.get(stage, available), available)
+
+    def run(self, stage, fn, *args, fallback=False):
+        """Run `fn(*args)` within the stage budget; raises StageTimeout if it overruns.
+
+        An overrunning stage keeps going in a daemon thread and its result is
+        discarded, so anything it writes (e.g. the media cache) must be safe to
+        finish late. settle() gives it the rest of the deadline to do so;
+        after that the interpreter exit cuts it off.
+        """
+        budget = self.budget(stage, fallback)
+        if budget <= 0:
+            print(f"⏰ No time left for {stage}")
+            raise StageTimeout(stage, 0.0)
+        result = {}
+
+        def target():
+            try:
+                result["value"] = fn(*args)
+            except BaseException as e:
+                result["error"] = e
+
+        start = time.monotonic()
+        thread = threading.Thread(target=target, name=f"stage-{stage}", daemon=True)
+        thread.start()
+        thread.join(budget)
+        if thread.is_alive():
+            print(f"⏰ {stage} overran its {budget:.1f}s budget")
+            self.overruns.append((stage, thread))
+            raise StageTimeout(stage, budget)
+        print(f"⏱️ {stage} took {time.monotonic() - start:.1f}s")
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+
+
+    def settle(self, stages=None):
+        """Wait, within what is left of the deadline, for overrun `stages` (default: all) to finish.
+
+        Only worth it for stages whose late result is kept somewhere, like a
+        render finishing into the media cache.
+        """
+        waiting = [(stage, thread) for stage, thread in self.overruns if stages is None or stage in stages]
+        for stage, thread in waiting:
+            if thread.is_alive():
+                print(f"⏳ Waiting up to {self.remaining():.0f}s for {stage} to finish")
+                thread.join(self.remaining())
+        unfinished = [stage for stage, thread in waiting if thread.is_alive()]
+        if unfinished:
+            print(f"⏰ Abandoning {', '.join(unfinished)} at the deadline")
+        return not unfinished
+
+
+def posting_deadline(total=None):
+    """Deadline for one scheduled post, with the default stage budgets."""
+    return Deadline(POST_DEADLINE if total is None else total, STAGE_BUDGETS, FALLBACK_RESERVE)
@@ -0,0 +1,70 @@
+import os
+
+# ------------------------------------------------
+# Encode profiles for lyric videos
+# ------------------------------------------------
+# A lyric video is a still card over a short clip, so x264 spends almost
+# nothing on motion. The knobs that matter are the preset (CPU time), CRF
+# (quality/size), the frame rate and the audio bitrate.
+ENCODE_PROFILES = {
+    "fast": {
+        "preset": "ultrafast",
+        "crf": 28,
+        "tune": "stillimage",
+        "fps": 10,
+        "threads": os.cpu_count() or 1,
+        "audio_bitrate": "128k",
+    },
+    "balanced": {
+        "preset": "veryfast",
+        "crf": 23,
+        "tune": "stillimage",
+        "fps": 24,
+        "threads": os.cpu_count() or 1,
+        "audio_bitrate": "128k",
+    },
+    "small": {
+        "preset": "slow",
+        "crf": 30,
+        "tune": "stillimage",
+        "fps": 12,
+        "threads": os.cpu_count() or 1,
+        "audio_bitrate": "96k",
+    },
+}
+
+DEFAULT_PROFILE = os.getenv("ENCODE_PROFILE", "balanced")
+
+
+def get_encode_profile(name=None):
+    name = name or DEFAULT_PROFILE
+    if name not in ENCODE_PROFILES:
+        raise ValueError(f"Unknown encode profile '{name}'. Choose from: {', '.join(ENCODE_PROFILES)}")
+    return ENCODE_PROFILES[name]
+
+
+def write_videofile_kwargs(name=None):
+    """Keyword arguments for moviepy's write_videofile for the given profile."""
+    profile = get_encode_profile(name)
+    return {
+        "codec": "libx264",
+        "audio_codec": "aac",
+        "fps": profile["fps"],
+        "preset": profile["preset"],
+        "threads": profile["threads"],
+        "audio_bitrate": profile["audio_bitrate"],
+        "ffmpeg_params": ["-crf", str(profile["crf"]), "-tune", profile["tune"]],
+    }
+
+
+def x264_args(name=None):
+    """ffmpeg output arguments for encoding video directly with the given profile."""
+    profile = get_encode_profile(name)
+    return [
+        "-c:v", "libx264",
+        "-preset", profile["preset"],
+        "-crf", str(profile["crf"]),
+        "-tune", profile["tune"],
+        "-threads", str(profile["threads"]),
+        "-pix_fmt", "yuv420p",
+    ]
@@ -0,0 +1,61 @@
+import atexit
+import subprocess
+
+# moviepy resolves the ffmpeg binary it ships with (imageio-ffmpeg) or the one
+# named by FFMPEG_BINARY; use the same one so every stage agrees on codecs
+from moviepy.config import FFMPEG_BINARY
+
+
+# ffmpeg processes still running. One started from a daemon thread (an
+# overrun deadline stage) would outlive the interpreter, so they are killed
+# at exit.
+_running = set()
+
+
+def run_ffmpeg(args, input=None, timeout=None):
+    """Run ffmpeg quietly and return its stdout, raising with stderr on failure."""
+    cmd = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", *args]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE if input is not None else None,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _running.add(process)
+    try:
+        stdout, stderr = process.communicate(input=input, timeout=timeout)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        _running.discard(process)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode('utf-8', 'replace').strip()}")
+    return stdout
+
+
+@atexit.register
+def _kill_running():
+    for process in list(_running):
+        process.kill()
+        process.wait()
+
+
+def mux(video_path, audio_path, output_path, timeout=None):
+    """Combine a video-only file and an encoded audio file without re-encoding either."""
+    run_ffmpeg([
+        "-i", video_path,
+        "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c", "copy",
+        "-shortest",
+        "-movflags", "+faststart",
+        output_path,
+    ], timeout=timeout)
+    return output_path
+
+
+def media_info(path, timeout=30):
+    """What `ffmpeg -i` reports about `path` (container, duration, streams), ffprobe-style."""
+    # With no output file ffmpeg exits non-zero after describing the input,
+    # so the description on stderr is the result either way
+    cmd = [FFMPEG_BINARY, "-hide_banner", "-i", path]
+    result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    return result.stderr.decode("utf-8", "replace")
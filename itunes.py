@@ -0,0 +1,32 @@
+import functools
+
+import requests
+
+from title_index import similarity, strip_variants
+
+# ------------------------------------------------
+# iTunes Search
+# ------------------------------------------------
+# One search serves both the artwork and the preview lookup. Results are
+# checked against the requested title and artist instead of trusting the
+# first hit, which is often a cover, karaoke track or different song.
+ITUNES_SEARCH_URL = "https://itunes.apple.com/search"
+MIN_TITLE_SIMILARITY = 0.6
+
+
+@functools.lru_cache(maxsize=128)
+def lookup_track(song_title, artist):
+    title = strip_variants(song_title)
+    response = requests.get(ITUNES_SEARCH_URL, params={
+        "term": f"{artist} {title}",
+        "media": "music",
+        "entity": "song",
+        "limit": 10,
+    }, timeout=10)
+    response.raise_for_status()
+    for result in response.json().get("results", []):
+        if artist.lower() not in result.get("artistName", "").lower():
+            continue
+        if similarity(result.get("trackName", ""), title) >= MIN_TITLE_SIMILARITY:
+            return result
+    return None
@@ -0,0 +1,53 @@
+import atexit
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from io import BytesIO
+
+# ------------------------------------------------
+# Per-job scratch space
+# ------------------------------------------------
+# Each post gets its own directory (on tmpfs when the host has one) for the
+# files the encoder has to see on disk; everything else stays in memory.
+# The directory is removed when the job ends, whether it succeeded or not.
+JOB_TMP_ROOT = os.getenv("JOB_TMP_ROOT") or ("/dev/shm" if os.access("/dev/shm", os.W_OK) else None)
+
+# Work directories still in use. A job running in a daemon thread (an
+# overrun deadline stage) never reaches its `finally` when the interpreter
+# exits, so whatever is left here is removed at exit instead.
+_live_workdirs = set()
+
+
+class Job:
+    def __init__(self, workdir):
+        self.workdir = workdir
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+
+@contextmanager
+def job_workdir(prefix="lyricjob-"):
+    workdir = tempfile.mkdtemp(prefix=prefix, dir=JOB_TMP_ROOT)
+    _live_workdirs.add(workdir)
+    try:
+        yield Job(workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        _live_workdirs.discard(workdir)
+
+
+@atexit.register
+def _remove_live_workdirs():
+    for workdir in list(_live_workdirs):
+        print(f"🧹 Removing unfinished job directory {workdir}")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def image_to_png(img):
+    """Encode a PIL image to an in-memory PNG buffer."""
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    buf.seek(0)
+    return buf
@@ -0,0 +1,51 @@
+from PIL import Image, ImageDraw
+
+# ------------------------------------------------
+# Line-by-line lyric reveal
+# ------------------------------------------------
+# Each lyric line is drawn once onto its own transparent layer, and a frame
+# is composited only when another line appears. A card with four lines is
+# five frames, not 15 seconds of redrawn frames; video_render encodes them
+# at a variable frame rate.
+REVEAL_LEAD_IN = 0.5  # seconds of title/artwork before the first line
+MAX_REVEAL_STEP = 1.5  # seconds between lines
+REVEAL_SHARE = 0.6  # all lines are in by this share of the video at the latest
+
+
+def line_layers(size, lines, font, center, fill, spacing=4):
+    """One RGBA layer per line, laid out like draw.multiline_text(center, ..., anchor="mm", align="center")."""
+    measure = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    line_spacing = measure.textbbox((0, 0), "A", font=font)[3] + spacing
+    top = center[1] - (len(lines) - 1) * line_spacing / 2.0
+    layers = []
+    for i, line in enumerate(lines):
+        layer = Image.new("RGBA", size, (0, 0, 0, 0))
+        ImageDraw.Draw(layer).text((center[0], top + i * line_spacing), line, font=font, fill=fill, anchor="mm")
+        layers.append(layer)
+    return layers
+
+
+def reveal_times(count, duration):
+    """Start time of each line, spread over the first part of the video."""
+    if not count:
+        return []
+    step = min(MAX_REVEAL_STEP, max(0.0, duration * REVEAL_SHARE - REVEAL_LEAD_IN) / count)
+    return [REVEAL_LEAD_IN + i * step for i in range(count)]
+
+
+def composite(base, layers):
+    """The fully revealed card, as used for the static video and image-only posts."""
+    frame = base.convert("RGBA")
+    for layer in layers:
+        frame = Image.alpha_composite(frame, layer)
+    return frame.convert("RGB")
+
+
+def reveal_keyframes(base, layers, duration):
+    """[(start_time, RGB image)] for the base card followed by one frame per revealed line."""
+    frame = base.convert("RGBA")
+    keyframes = [(0.0, frame.convert("RGB"))]
+    for start, layer in zip(reveal_times(len(layers), duration), layers):
+        frame = Image.alpha_composite(frame, layer)
+        keyframes.append((start, frame.convert("RGB")))
+    return keyframes
@@ -6,14 +6,25 @@ import random
 from dotenv import load_dotenv
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
-from moviepy.audio.io.AudioFileClip import AudioFileClip
-from moviepy.video.VideoClip import ImageClip
 from moviepy.audio.AudioClip import CompositeAudioClip
-from moviepy.audio.AudioClip import concatenate_audioclips
 from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
 import time
 import re
 import lyricsgenius
+import argparse
+from encoding import ENCODE_PROFILES, DEFAULT_PROFILE
+from video_render import render_still_video, render_keyframe_video
+from lyric_animation import line_layers, composite, reveal_keyframes
+import media_cache
+import outbox
+import catalog
+from lyrics_router import LyricsRouter
+from title_index import similarity
+import itunes
+from job_context import job_workdir, image_to_png
+from deadline import posting_deadline, StageTimeout
+import snippet_cache
+import media_preflight
 
 # Fix UnicodeEncodeError on Windows
 sys.stdout.reconfigure(encoding='utf-8')
@@ -49,10 +60,17 @@ client = tweepy.Client(
     bearer_token=BEARER_TOKEN
 )
 
-# ✅ Paths
-IMAGE_OUTPUT = "mj_lyric_image.png"
-AUDIO_OUTPUT = "mj_audio_preview.mp3"
+# ✅ Scratch file names inside each job's work directory
 VIDEO_OUTPUT = "mj_lyric_video.mp4"
+OUTBOX_DB = "lyrics_outbox.db"
+SNIPPET_CACHE = "lyrics_snippets.json"
+LYRICS_STATS_FILE = "lyrics_bot_provider_stats.json"
+
+# ✅ Bump when the card layout or video pipeline changes so stale cached videos are not reused
+TEMPLATE_VERSION = "lyric_loops-1200x675-v2"
+
+# ✅ Card size; the video is scaled to 1280x720
+CARD_SIZE = (1200, 675)
 
 # ✅ Background Colors
 PASTEL_COLORS = ["#FFF8E1", "#FCE4EC", "#E8F5E9", "#E3F2FD", "#F3E5F5", "#FDF5DC", "#FFE5E8", "#D7F4FF", "#EDE7F6", "#DFFFE5", "#FFE7D9", "#FFDDE0", "#E0F7FA", "#FFF9E5", "#F2F2F2"]
@@ -60,13 +78,15 @@ PASTEL_COLORS = ["#FFF8E1", "#FCE4EC", "#E8F5E9", "#E3F2FD", "#F3E5F5", "#FDF5DC
 # ------------------------------------------------
 # ✅ Fetch Random Michael Jackson Song
 # ------------------------------------------------
-def fetch_random_mj_song():
+def fetch_random_mj_song(deadline=None):
     try:
-        url = f"http://ws.audioscrobbler.com/2.0/?method=artist.gettoptracks&artist=Michael+Jackson&api_key={LASTFM_API_KEY}&format=json"
-        response = requests.get(url)
-        response.raise_for_status()
-        tracks = response.json().get("toptracks", {}).get("track", [])
-        random_track = random.choice(tracks)
+        # Every page of Last.fm top tracks, synced locally and refreshed weekly
+        artist = "Michael Jackson"
+        tracks = catalog.get_catalog("lastfm", artist,
+                                     lambda current: catalog.sync_lastfm_catalog(LASTFM_API_KEY, artist, current),
+                                     deadline=deadline)
+        # Weighted by playcount
+        random_track = catalog.weighted_choice("lastfm", tracks, catalog.lastfm_weight)
         song_title = random_track.get("name", "Unknown Song")
         print(f"✅ Selected Song: {song_title}")
         return song_title
@@ -77,37 +97,43 @@ def fetch_random_mj_song():
 # ------------------------------------------------
 # ✅ Fetch Lyrics
 # ------------------------------------------------
+def fetch_lyrics_ovh(artist, song_title):
+    response = requests.get(f"https://api.lyrics.ovh/v1/{artist}/{song_title}", timeout=10)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json().get("lyrics") or None
+
+def fetch_lyrics_genius(artist, song_title):
+    song = genius.search_song(song_title, artist)
+    # Genius returns its closest match; reject it if it is a different song
+    if song and song.lyrics and similarity(song.title, song_title) >= 0.5:
+        return song.lyrics
+    return None
+
+# ✅ Providers are ordered by observed hit rate and latency, not a fixed list
+lyrics_router = LyricsRouter([
+    ("lyrics.ovh", fetch_lyrics_ovh),
+    ("genius", fetch_lyrics_genius),
+], LYRICS_STATS_FILE)
+
 def fetch_lyrics(song_title, artist):
-    try:
-        # Primary API: Lyrics.ovh
-        response = requests.get(f"https://api.lyrics.ovh/v1/{artist}/{song_title}")
-        response.raise_for_status()
-        data = response.json()
-        return data.get("lyrics", "Lyrics not found")
-    except Exception as e:
-        print(f"❌ Error fetching lyrics from Lyrics.ovh: {e}")
-        print("⚠️ Falling back to Genius API...")
-        # Fallback: Genius API
-        try:
-            song = genius.search_song(song_title, artist)
-            if song and song.lyrics:
-                return song.lyrics
-            else:
-                return "Lyrics not found on Genius API"
-        except Exception as genius_error:
-            print(f"❌ Error fetching lyrics from Genius API: {genius_error}")
-            return "Lyrics not found"
+    # Ask providers for the canonical catalog title, not the release variant
+    canonical = catalog.title_index("lastfm", artist).canonical(song_title)
+    lyrics = lyrics_router.fetch(artist, canonical)
+    if not lyrics:
+        print("❌ Lyrics not found from any provider")
+    return lyrics
 
 # ------------------------------------------------
 # ✅ Fetch Album Cover
 # ------------------------------------------------
 def fetch_album_cover(song_title, artist):
     try:
-        url = f"https://itunes.apple.com/search?term={artist} {song_title}&media=music"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        return data['results'][0].get('artworkUrl100')
+        track = itunes.lookup_track(song_title, artist)
+        if not track:
+            raise Exception("no matching iTunes track")
+        return track.get('artworkUrl100')
     except Exception as e:
         print(f"❌ Error fetching album cover: {e}")
     return None
@@ -117,11 +143,11 @@ def fetch_album_cover(song_title, artist):
 # ------------------------------------------------
 def fetch_audio_preview(song_title, artist):
     try:
-        url = f"https://itunes.apple.com/search?term={artist} {song_title}&media=music"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        return data['results'][0].get('previewUrl')
+        # Same cached iTunes search as the album cover
+        track = itunes.lookup_track(song_title, artist)
+        if not track:
+            raise Exception("no matching iTunes track")
+        return track.get('previewUrl')
     except Exception as e:
         print(f"❌ Error fetching audio preview: {e}")
     return None
@@ -141,94 +167,119 @@ def adjust_font_size(draw, text, max_width, max_height, font_path, start_size=55
         font_size -= 2
     return ImageFont.truetype(font_path, 10)
 
+# ------------------------------------------------
+# ✅ Select Lyrics
+# ------------------------------------------------
+def select_lyrics(lyrics):
+    # Extract lines from the lyrics and randomly select a few
+    lines = [line.strip() for line in lyrics.split('\n') if line.strip()]
+    return '\n'.join(random.sample(lines, min(len(lines), 2)))
+
 # ------------------------------------------------
 # ✅ Generate Lyric Image
 # ------------------------------------------------
-def generate_lyric_image(song_title, artist, lyrics, album_cover_url):
+def render_card_layers(song_title, artist, selected_lyrics, album_cover_url, background, album_cover_data=None):
+    """The card without lyrics, plus one transparent layer per lyric line."""
+    # Create the base image
+    img = Image.new("RGB", CARD_SIZE, color=background)
+    draw = ImageDraw.Draw(img)
+
+    # Load fonts with a fallback mechanism
     try:
-        # Extract lines from the lyrics and randomly select a few
-        lines = [line.strip() for line in lyrics.split('\n') if line.strip()]
-        selected_lyrics = '\n'.join(random.sample(lines, min(len(lines), 2)))
+        title_font = ImageFont.truetype("./fonts/arialbd.ttf", 45)
+        artist_font = ImageFont.truetype("./fonts/arial.ttf", 30)
+        lyrics_font = ImageFont.truetype("./fonts/arialbd.ttf", 70)
+    except IOError:
+        # Fallback to default font if specified fonts are not found
+        title_font = ImageFont.load_default()
+        artist_font = ImageFont.load_default()
+        lyrics_font = ImageFont.load_default()
 
-        # Create the base image
-        img = Image.new("RGB", (1200, 675), color=random.choice(PASTEL_COLORS))
-        draw = ImageDraw.Draw(img)
+    # Draw text on the image
+    draw.text((50, 50), song_title, font=title_font, fill="black")
+    draw.text((50, 120), artist, font=artist_font, fill="grey")
+    lyric_layers = line_layers(CARD_SIZE, selected_lyrics.split('\n'), lyrics_font, (600, 350), "black")
 
-        # Load fonts with a fallback mechanism
-        try:
-            title_font = ImageFont.truetype("./fonts/arialbd.ttf", 45)
-            artist_font = ImageFont.truetype("./fonts/arial.ttf", 30)
-            lyrics_font = ImageFont.truetype("./fonts/arialbd.ttf", 70)
-        except IOError:
-            # Fallback to default font if specified fonts are not found
-            title_font = ImageFont.load_default()
-            artist_font = ImageFont.load_default()
-            lyrics_font = ImageFont.load_default()
-
-        # Draw text on the image
-        draw.text((50, 50), song_title, font=title_font, fill="black")
-        draw.text((50, 120), artist, font=artist_font, fill="grey")
-        draw.multiline_text((600, 350), selected_lyrics, font=lyrics_font, fill="black", anchor="mm", align="center")
-
-        # Add the album cover if available
-        if album_cover_url and isinstance(album_cover_url, str):
-            response = requests.get(album_cover_url)
-            album_cover = Image.open(BytesIO(response.content)).resize((150, 150))
-            img.paste(album_cover, (50, 500))
-
-        # Add watermark or branding text
-        draw.text((1050, 630), "@lyric_loops", font=ImageFont.truetype("/usr/share/fonts/truetype/msttcorefonts/arialbd.ttf", 25), fill="black")
-
-        # Save the generated image
-        img.save(IMAGE_OUTPUT, format="PNG")
-        print("✅ Image saved successfully.")
-        return IMAGE_OUTPUT, selected_lyrics
+    # Add the album cover if available
+    if album_cover_data is None and album_cover_url and isinstance(album_cover_url, str):
+        album_cover_data = requests.get(album_cover_url, timeout=10).content
+    if album_cover_data:
+        album_cover = Image.open(BytesIO(album_cover_data)).resize((150, 150))
+        img.paste(album_cover, (50, 500))
+
+    # Add watermark or branding text
+    draw.text((1050, 630), "@lyric_loops", font=ImageFont.truetype("/usr/share/fonts/truetype/msttcorefonts/arialbd.ttf", 25), fill="black")
+    return img, lyric_layers
+
+def generate_lyric_image(song_title, artist, lyrics, album_cover_url, selected_lyrics=None, background=None, album_cover_data=None):
+    try:
+        if selected_lyrics is None:
+            selected_lyrics = select_lyrics(lyrics)
+        if background is None:
+            background = random.choice(PASTEL_COLORS)
+
+        img, lyric_layers = render_card_layers(song_title, artist, selected_lyrics, album_cover_url, background, album_cover_data)
+
+        # Render the image to an in-memory PNG
+        image = image_to_png(composite(img, lyric_layers))
+        print("✅ Image rendered successfully.")
+        return image, selected_lyrics
 
     except Exception as e:
         print(f"❌ Error generating image: {e}")
         return None, None
 
-
 # ------------------------------------------------
-# ✅ Process Audio
+# ✅ Generate Animated Lyric Keyframes
 # ------------------------------------------------
-def process_audio(audio_path, target_duration=15):
-    audio_clip = AudioFileClip(audio_path)
-    if audio_clip.duration > target_duration:
-        audio_clip = audio_clip.subclipped(0, target_duration)
-    else:
-        loops = int(target_duration // audio_clip.duration) + 1
-        audio_clips = [audio_clip] * loops
-        audio_clip = concatenate_audioclips(audio_clips).subclipped(0, target_duration)
-    return audio_clip
+def generate_lyric_keyframes(song_title, artist, selected_lyrics, background, album_cover_data=None, duration=15):
+    """Keyframes revealing the lyric lines one at a time, plus the fully revealed card as a PNG."""
+    try:
+        # Each line is drawn once; a frame is composited only when a new line appears
+        img, lyric_layers = render_card_layers(song_title, artist, selected_lyrics, None, background, album_cover_data)
+        print(f"✅ Rendered {len(lyric_layers)} lyric line layers.")
+        return image_to_png(composite(img, lyric_layers)), reveal_keyframes(img, lyric_layers, duration)
+    except Exception as e:
+        print(f"❌ Error generating keyframes: {e}")
+        return None, None
 
-# ------------------------------------------------
-# ✅ Create Image Clip
-# ------------------------------------------------
-def create_image_clip(image_path, duration=15):
-    image_clip = ImageClip(image_path).with_duration(duration)
-    return image_clip
 
 # ------------------------------------------------
 # ✅ Create Video
 # ------------------------------------------------
-def create_video(image_path, audio_path, output_path, duration=15):
+def create_video(image, audio, output_path, duration=15, profile=None, keyframes=None):
     try:
-        # Create image and audio clips
-        image_clip = create_image_clip(image_path, duration)
-        audio_clip = process_audio(audio_path, duration)
-        
-        # Combine image and audio into a video clip
-        video_clip = image_clip.with_audio(audio_clip)
-        
-        # Resize the video to 1280x720
-        video_clip = video_clip.resized((1280, 720))
-        
-        # Write the video file
-        video_clip.write_videofile(output_path, codec="libx264", fps=24)
+        # Audio is looped/trimmed once per track and muxed in; clips and
+        # scratch files are released even if encoding fails
+        if keyframes:
+            # ✅ Animated card: only the frames where a new line appears are encoded
+            render_keyframe_video(keyframes, audio, output_path, duration, profile, size=(1280, 720))
+        else:
+            render_still_video(image, audio, output_path, duration, profile, size=(1280, 720))
         print("✅ Video created successfully at 1280x720 resolution.")
+        return True
     except Exception as e:
         print(f"❌ Error generating video: {e}")
+        return False
+
+# ------------------------------------------------
+# ✅ Download Artwork and Audio
+# ------------------------------------------------
+def download_album_cover(song_title, artist):
+    album_cover_url = fetch_album_cover(song_title, artist)
+    return requests.get(album_cover_url, timeout=10).content if album_cover_url else None
+
+def download_audio_preview(song_title, artist):
+    audio_preview_url = fetch_audio_preview(song_title, artist)
+    return requests.get(audio_preview_url, timeout=10).content if audio_preview_url else None
+
+def render_video(image, audio_data, cache_key, profile, keyframes=None):
+    """Render into the media cache; an overrun render that completes before the deadline still lands there."""
+    with job_workdir() as job:
+        output_path = job.path(VIDEO_OUTPUT)
+        if create_video(image, audio_data, output_path, profile=profile, keyframes=keyframes):
+            return media_cache.store(cache_key, output_path)
+    return None
 
 def sanitize_hashtag(text):
     """Sanitize text to be hashtag-friendly (no spaces or special characters)."""
@@ -237,98 +288,259 @@ def sanitize_hashtag(text):
 # ------------------------------------------------
 # ✅ Tweet Video
 # ------------------------------------------------
-def tweet_video(song_title, artist):
-    """Creates a tweet with the uploaded video using API v2 with rate limit handling."""
-    try:
-        # Step 1: Upload Video via API v1.1
-        m1 = api.media_upload(
-            VIDEO_OUTPUT,
-            media_category='tweet_video'
-        )
-        
-        # Ensure media_id is correctly extracted
-        media_id = m1.media_id_string  # Ensures it's a string
-        print(f"✅ Video uploaded successfully. Media ID: {media_id}")
+def upload_media(media_path, profile=None):
+    """Upload a video (or the PNG card of an image-only post) via API v1.1; returns its media_id and how long it stays valid."""
+    category = 'tweet_image' if media_path.endswith(".png") else 'tweet_video'
+    # Catch anything Twitter would reject before paying for the upload
+    media_path = media_preflight.preflight(media_path, profile)
+    m1 = api.media_upload(
+        media_path,
+        media_category=category
+    )
+    
+    # Ensure media_id is correctly extracted
+    media_id = m1.media_id_string  # Ensures it's a string
+    print(f"✅ Media uploaded successfully. Media ID: {media_id}")
+    return media_id, getattr(m1, 'expires_after_secs', None)
+
+def wait_for_processing(media_id, deadline, fallback=False):
+    """Block until Twitter has finished processing the uploaded media, within the processing budget."""
+    budget = deadline.budget("processing", fallback)
+    give_up_at = time.monotonic() + budget
+    status = api.get_media_upload_status(media_id)
+    processing_info = getattr(status, 'processing_info', None)
+    state = processing_info.get('state') if processing_info else "succeeded"
+    while state != "succeeded":
+        if state == "failed":
+            raise Exception("❌ Media processing failed.")
+        wait_time = processing_info.get('check_after_secs', 5)
+        if time.monotonic() + wait_time > give_up_at:
+            raise StageTimeout("processing", budget)
+        print(f"⏳ Media still processing. Waiting {wait_time} seconds...")
+        time.sleep(wait_time)
+
+        # Re-check processing info
+        status = api.get_media_upload_status(media_id)
+        processing_info = getattr(status, 'processing_info', None)
+        state = processing_info.get('state') if processing_info else "succeeded"
+
+    print("✅ Media processing completed successfully.")
+
+def create_tweet(tweet_text, media_id, deadline, fallback=False):
+    """Create the tweet via API v2 with rate limit handling; returns the tweet ID or None."""
+    max_retries = 5
+    retry_delay = 60  # Start with a 60-second delay
+    
+    for attempt in range(max_retries):
+        try:
+            # ✅ Attempt to create a tweet with media
+            response = client.create_tweet(
+                text=tweet_text,
+                media_ids=[media_id]  # Correct usage in API v2
+            )
+            
+            tweet_id = response.data['id']
+            print(f"✅ Tweeted successfully: https://twitter.com/user/status/{tweet_id}")
+            return tweet_id
         
-        # Step 2: Check Media Processing
-        processing_info = getattr(m1, 'processing_info', None)
-        if processing_info:
-            state = processing_info.get('state')
-            while state != "succeeded":
-                if state == "failed":
-                    raise Exception("❌ Media processing failed.")
-                wait_time = processing_info.get('check_after_secs', 5)
-                print(f"⏳ Media still processing. Waiting {wait_time} seconds...")
-                time.sleep(wait_time)
-
-                # Re-check processing info
-                status = api.get_status(m1.media_id)
-                processing_info = getattr(status, 'processing_info', None)
-                state = processing_info.get('state') if processing_info else "succeeded"
-
-        print("✅ Media processing completed successfully.")
+        except tweepy.errors.TooManyRequests as e:
+            reset_time = int(e.response.headers.get("x-rate-limit-reset", time.time() + retry_delay))
+            wait_time = max(reset_time - time.time(), retry_delay)
+            if wait_time > deadline.budget("tweet", fallback):
+                # Leave the post in the outbox for the next run instead of sleeping past the slot
+                print(f"⏰ Rate limit resets in {int(wait_time)} seconds, past the posting deadline.")
+                break
+            print(f"⚠️ Rate limit exceeded. Retrying in {int(wait_time)} seconds...")
+            time.sleep(wait_time)
         
-        # Step 3: Prepare Tweet Content
-        artist_hashtag = f"#{sanitize_hashtag(artist)}"
-        tweet_text = f"🎵 {song_title} by {artist}\n#Trending #Music {artist_hashtag}"
+        except tweepy.errors.BadRequest as e:
+            print(f"❌ Bad Request: {e.response.text}")
+            break  # Exit on incorrect request
         
-        # Step 4: Handle Rate Limit with Retry Logic
-        max_retries = 5
-        retry_delay = 60  # Start with a 60-second delay
+        except tweepy.errors.TweepyException as e:
+            print(f"❌ Tweepy error tweeting: {e}")
+            break  # Exit on other Tweepy exceptions
         
-        for attempt in range(max_retries):
-            try:
-                # ✅ Attempt to create a tweet with media
-                response = client.create_tweet(
-                    text=tweet_text,
-                    media_ids=[media_id]  # Correct usage in API v2
-                )
-                
-                tweet_id = response.data['id']
-                print(f"✅ Video tweeted successfully: https://twitter.com/user/status/{tweet_id}")
-                break  # Exit loop on success
-            
-            except tweepy.errors.TooManyRequests as e:
-                reset_time = int(e.response.headers.get("x-rate-limit-reset", time.time() + retry_delay))
-                wait_time = max(reset_time - time.time(), retry_delay)
-                print(f"⚠️ Rate limit exceeded. Retrying in {int(wait_time)} seconds...")
-                time.sleep(wait_time)
-            
-            except tweepy.errors.BadRequest as e:
-                print(f"❌ Bad Request: {e.response.text}")
-                break  # Exit on incorrect request
-            
-            except tweepy.errors.TweepyException as e:
-                print(f"❌ Tweepy error tweeting video: {e}")
-                break  # Exit on other Tweepy exceptions
-            
-            except Exception as e:
-                print(f"❌ Unexpected error tweeting video: {e}")
-                break  # Exit on unexpected errors
-    
+        except Exception as e:
+            print(f"❌ Unexpected error tweeting: {e}")
+            break  # Exit on unexpected errors
+    return None
+
+def publish_entry(outbox_db, entry, deadline, fallback=False, profile=None):
+    """Publish an outbox entry under the deadline; fallback posts may use the reserved time."""
+    is_video = not entry["media_path"].endswith(".png")
+    return outbox.publish(
+        outbox_db, entry,
+        lambda media_path: deadline.run("upload", upload_media, media_path, profile, fallback=fallback),
+        lambda text, media_id: create_tweet(text, media_id, deadline, fallback),
+        (lambda media_id: wait_for_processing(media_id, deadline, fallback)) if is_video else None,
+    )
+
+def media_rejected(e):
+    """True when the media itself cannot go out (failed preflight, still processing at the budget).
+
+    Only then does a cheaper post take the slot; anything else, like a rate
+    limit, is left pending in the outbox for the next run.
+    """
+    return isinstance(e, media_preflight.PreflightError) or (isinstance(e, StageTimeout) and e.stage == "processing")
+
+def tweet_media(song_title, artist, media_path, outbox_db, post_key, deadline, fallback=False, profile=None):
+    """Tweets the video (or card image), resuming from the outbox on retries.
+
+    Raises when media_rejected(); otherwise returns whether the post went out.
+    """
+    artist_hashtag = f"#{sanitize_hashtag(artist)}"
+    tweet_text = f"🎵 {song_title} by {artist}\n#Trending #Music {artist_hashtag}"
+    try:
+        entry = outbox.enqueue(outbox_db, post_key, tweet_text, media_path)
+        return publish_entry(outbox_db, entry, deadline, fallback, profile) is not None
     except tweepy.errors.TweepyException as e:
-        print(f"❌ Tweepy error tweeting video: {e}")
+        print(f"❌ Tweepy error tweeting: {e}")
+    except Exception as e:
+        if media_rejected(e):
+            raise
+        print(f"❌ Unexpected error tweeting: {e}")
+    return False
+
+# ------------------------------------------------
+# ✅ Resume Pending Posts
+# ------------------------------------------------
+def resume_pending_posts(outbox_db, deadline, profile=None):
+    """Finish a post that failed after rendering or uploading, reusing its media_id."""
+    for entry in outbox.pending(outbox_db):
+        print(f"🔁 Resuming pending post ({entry['state']}): {entry['text']!r}")
+        try:
+            if publish_entry(outbox_db, entry, deadline, profile=profile):
+                return True
+        except Exception as e:
+            print(f"❌ Error resuming pending post: {e}")
+    return False
+
+# ------------------------------------------------
+# ✅ Post New Video
+# ------------------------------------------------
+def post_new_video(profile, outbox_db, deadline, animate=False):
+    song_title = fetch_random_mj_song(deadline)
+    if not song_title:
+        return
+    artist = "Michael Jackson"
+
+    # ✅ Every stage has a budget; a slow stage falls back to something cheaper
+    try:
+        lyrics = deadline.run("lyrics", fetch_lyrics, song_title, artist)
+    except Exception as e:
+        print(f"❌ Lyrics unavailable: {e}")
+        lyrics = None
+    if lyrics:
+        selected_lyrics = select_lyrics(lyrics)
+        snippet_cache.remember(SNIPPET_CACHE, artist, song_title, selected_lyrics)
+    else:
+        cached = snippet_cache.fallback(SNIPPET_CACHE, artist, song_title)
+        if not cached:
+            print("❌ No lyrics and no cached snippet to fall back on")
+            return
+        song_title, selected_lyrics = cached
+        lyrics = selected_lyrics
+        print(f"♻️ Using a cached snippet from {song_title}")
+
+    try:
+        album_cover_data = deadline.run("artwork", download_album_cover, song_title, artist)
+    except Exception as e:
+        print(f"❌ Artwork unavailable: {e}")
+        album_cover_data = None
+    if not album_cover_data:
+        print("🖼️ Using the default card without album art")
+        album_cover_data = b""
+
+    try:
+        audio_data = deadline.run("audio", download_audio_preview, song_title, artist)
     except Exception as e:
-        print(f"❌ Unexpected error tweeting video: {e}")
+        print(f"❌ Audio preview unavailable: {e}")
+        audio_data = None
+
+    # Derive the background from the snippet so a repeat snippet renders identically
+    background = PASTEL_COLORS[int(media_cache.hash_bytes(selected_lyrics.encode("utf-8")), 16) % len(PASTEL_COLORS)]
+    video_path = None
+    image = None
+    if audio_data:
+        # The artwork and audio hashes key the media cache
+        cache_key = media_cache.render_key(
+            template=TEMPLATE_VERSION,
+            song_title=song_title,
+            artist=artist,
+            lyrics=selected_lyrics,
+            background=background,
+            artwork=media_cache.hash_bytes(album_cover_data),
+            audio=media_cache.hash_bytes(audio_data),
+            profile=profile,
+            animated=animate,
+        )
+        video_path = media_cache.lookup(cache_key)
+        if video_path:
+            print(f"♻️ Reusing cached video: {video_path}")
+        else:
+            # Only a cache miss pays for drawing the card
+            if animate:
+                image, keyframes = generate_lyric_keyframes(song_title, artist, selected_lyrics, background, album_cover_data)
+            else:
+                image, _ = generate_lyric_image(song_title, artist, lyrics, None,
+                                                selected_lyrics, background, album_cover_data)
+                keyframes = None
+            if image:
+                try:
+                    video_path = deadline.run("render", render_video, BytesIO(image.getvalue()),
+                                              audio_data, cache_key, profile, keyframes)
+                except Exception as e:
+                    print(f"❌ Video not ready in time: {e}")
+
+    post_key = None
+    if video_path:
+        # Each attempt gets its own outbox entry; retries resume it
+        post_key = f"{cache_key}:{int(time.time())}"
+        try:
+            if not tweet_media(song_title, artist, video_path, outbox_db, post_key, deadline, profile=profile):
+                print("📥 Video post left in the outbox for the next run")
+            return
+        except Exception as e:
+            print(f"❌ Video cannot be posted: {e}")
+
+    # ✅ Image-only fallback: the card needs no encoding or media processing
+    print("🖼️ Falling back to an image-only tweet")
+    if image is None:
+        image, _ = generate_lyric_image(song_title, artist, lyrics, None,
+                                        selected_lyrics, background, album_cover_data)
+        if not image:
+            return
+    card_hash = media_cache.hash_bytes(image.getvalue())
+    card_path = media_cache.store_bytes(card_hash, image.getvalue(), ".png")
+    try:
+        tweeted = tweet_media(song_title, artist, card_path, outbox_db, f"{card_hash}:{int(time.time())}",
+                              deadline, fallback=True)
+    except Exception as e:
+        print(f"❌ Image cannot be posted: {e}")
+        tweeted = False
+    if tweeted and post_key:
+        # The image-only post filled this slot; don't post the video next run too
+        outbox.abandon(outbox_db, post_key)
 
 # ------------------------------------------------
 # ✅ Main Execution
 # ------------------------------------------------
 if __name__ == "__main__":
-    song_title = fetch_random_mj_song()
-    if song_title:
-        artist = "Michael Jackson"
-        lyrics = fetch_lyrics(song_title, artist)
-        if lyrics:
-            album_cover_url = fetch_album_cover(song_title, artist)
-            image_path, selected_lyrics = generate_lyric_image(song_title, artist, lyrics, album_cover_url)
-            if image_path:
-                audio_preview_url = fetch_audio_preview(song_title, artist)
-                if audio_preview_url:
-                    # Download the audio preview
-                    response = requests.get(audio_preview_url)
-                    with open(AUDIO_OUTPUT, 'wb') as f:
-                        f.write(response.content)
-
-                    create_video(image_path, AUDIO_OUTPUT, VIDEO_OUTPUT)
-                    tweet_video(song_title, artist)
+    parser = argparse.ArgumentParser(description="Post a Michael Jackson lyric loop video.")
+    parser.add_argument("--profile", choices=sorted(ENCODE_PROFILES), default=DEFAULT_PROFILE,
+                        help="Encode profile for the lyric video")
+    parser.add_argument("--animate", action="store_true",
+                        help="Reveal the lyric lines one at a time instead of a static card")
+    args = parser.parse_args()
+
+    # ✅ The whole run, including any resumed post, has to fit the hourly slot
+    deadline = posting_deadline()
+    outbox_db = outbox.open_outbox(OUTBOX_DB)
+    if resume_pending_posts(outbox_db, deadline, args.profile):
+        print("✅ Posted a pending video from the outbox; no new song this run.")
+    else:
+        post_new_video(args.profile, outbox_db, deadline, args.animate)
+    # ✅ An overrun render may still finish into the media cache for the next post;
+    # its ffmpeg and work directory are cleaned up at exit if it does not
+    deadline.settle(("render",))
@@ -0,0 +1,189 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# ------------------------------------------------
+# Lyrics provider router
+# ------------------------------------------------
+# Providers are plain functions `fn(artist, title)` that return lyrics, return
+# None when they have no lyrics for the song, and raise when the request
+# itself failed. The router keeps per-provider hit rate and latency across
+# runs, skips providers whose circuit breaker is open, tries the cheapest
+# expected provider first, and hedges with the next one once the current one
+# runs past its usual (p95) latency. A provider that has recently answered
+# "no lyrics" for a title is not asked about that title again until the miss
+# expires, since a miss can also be a bad match or a page not yet written.
+#
+# fetch() returns None only when every provider cleanly answered "no lyrics".
+# If any provider errored or was skipped by its breaker, it raises
+# LyricsUnavailable instead, so callers never record an outage as a miss.
+#
+# A fetch abandoned by its caller's deadline keeps running in the background
+# while the next one starts, so the stats are only touched under a lock.
+STATS_FILE = os.getenv("LYRICS_STATS_FILE", "lyrics_provider_stats.json")
+
+FAILURE_THRESHOLD = 3        # consecutive errors before the breaker opens
+COOLDOWN = 15 * 60           # seconds before an open breaker lets one request through
+LATENCY_WINDOW = 50          # latencies kept per provider
+DEFAULT_P95 = 5.0            # seconds, until a provider has history
+MIN_HIT_RATE = 0.05
+MISS_MEMORY = 2000           # titles remembered per provider as known misses
+MISS_TTL = 7 * 24 * 60 * 60  # seconds before a known miss is asked about again
+
+
+class LyricsUnavailable(Exception):
+    pass
+
+
+class LyricsRouter:
+    def __init__(self, providers, stats_file=STATS_FILE):
+        self.providers = list(providers)
+        self.stats_file = stats_file
+        self._lock = threading.RLock()
+        self.stats = self._load_stats()
+
+    def _load_stats(self):
+        if not os.path.isfile(self.stats_file):
+            return {}
+        try:
+            with open(self.stats_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_stats(self):
+        """Best effort: failing to persist the stats must not lose the lyrics just fetched."""
+        try:
+            with self._lock:
+                data = json.dumps(self.stats, indent=2)
+            directory = os.path.dirname(os.path.abspath(self.stats_file))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(self.stats_file)}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.stats_file)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        except Exception as e:
+            print(f"⚠️ Could not save lyrics provider stats: {e}")
+
+    def _stat(self, name):
+        with self._lock:
+            stat = self.stats.setdefault(name, {
+                "attempts": 0, "hits": 0, "latencies": [],
+                "consecutive_errors": 0, "opened_at": None, "misses": {},
+            })
+            # Older stats files kept misses as an undated list; let them expire
+            if not isinstance(stat.get("misses"), dict):
+                stat["misses"] = {}
+            return stat
+
+    def p95(self, name):
+        latencies = sorted(self._stat(name)["latencies"])
+        if not latencies:
+            return DEFAULT_P95
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def hit_rate(self, name):
+        stat = self._stat(name)
+        if not stat["attempts"]:
+            return 1.0
+        return stat["hits"] / stat["attempts"]
+
+    def is_open(self, name):
+        opened_at = self._stat(name)["opened_at"]
+        # After the cooldown the breaker is half-open: one request may probe it
+        return opened_at is not None and time.time() - opened_at < COOLDOWN
+
+    def ordered(self):
+        """Available providers, cheapest expected time-to-lyrics first."""
+        available = [(name, fn) for name, fn in self.providers if not self.is_open(name)]
+        return sorted(available, key=lambda p: self.p95(p[0]) / max(self.hit_rate(p[0]), MIN_HIT_RATE))
+
+    def known_miss(self, name, title):
+        with self._lock:
+            missed_at = self._stat(name)["misses"].get(title.lower())
+            return missed_at is not None and time.time() - missed_at < MISS_TTL
+
+    def _record(self, name, title, latency, lyrics, error):
+        with self._lock:
+            self._update_stat(name, title, latency, lyrics, error)
+
+    def _update_stat(self, name, title, latency, lyrics, error):
+        stat = self._stat(name)
+        stat["attempts"] += 1
+        stat["latencies"] = (stat["latencies"] + [round(latency, 3)])[-LATENCY_WINDOW:]
+        if error is not None:
+            stat["consecutive_errors"] += 1
+            if stat["consecutive_errors"] >= FAILURE_THRESHOLD:
+                stat["opened_at"] = time.time()
+                print(f"🚫 Circuit open for {name} after {stat['consecutive_errors']} errors")
+            return
+        stat["consecutive_errors"] = 0
+        stat["opened_at"] = None
+        if lyrics:
+            stat["hits"] += 1
+        else:
+            now = time.time()
+            misses = {t: at for t, at in stat["misses"].items() if now - at < MISS_TTL}
+            misses[title.lower()] = now
+            stat["misses"] = dict(sorted(misses.items(), key=lambda item: item[1])[-MISS_MEMORY:])
+
+    def fetch(self, artist, title):
+        available = self.ordered()
+        unavailable = [name for name, _ in self.providers if name not in dict(available)]
+        order = [(name, fn) for name, fn in available if not self.known_miss(name, title)]
+        if not order:
+            if unavailable:
+                raise LyricsUnavailable(f"No lyrics provider available for {title} ({', '.join(unavailable)} circuit-open)")
+            print(f"⚠️ Every lyrics provider already has no lyrics for {title}")
+            return None
+
+        pool = ThreadPoolExecutor(max_workers=len(order))
+        running = {}
+        next_index = 0
+        launch_next = True
+        try:
+            while next_index < len(order) or running:
+                if launch_next and next_index < len(order):
+                    name, fn = order[next_index]
+                    next_index += 1
+                    print(f"🎵 Asking {name} for lyrics: {artist} - {title}")
+                    running[pool.submit(fn, artist, title)] = (name, time.monotonic())
+                    launch_next = False
+
+                # Hedge once the newest request passes its provider's p95
+                hedge_after = None
+                if next_index < len(order):
+                    newest_name, newest_start = list(running.values())[-1]
+                    hedge_after = max(0.0, self.p95(newest_name) - (time.monotonic() - newest_start))
+                done, _ = wait(running, timeout=hedge_after, return_when=FIRST_COMPLETED)
+                if not done:
+                    launch_next = True
+                    continue
+
+                for future in done:
+                    name, start = running.pop(future)
+                    latency = time.monotonic() - start
+                    try:
+                        lyrics, error = future.result(), None
+                    except Exception as e:
+                        lyrics, error = None, e
+                        unavailable.append(name)
+                        print(f"❌ {name} failed for {title}: {e}")
+                    self._record(name, title, latency, lyrics, error)
+                    if lyrics:
+                        print(f"✅ Lyrics from {name} in {latency:.2f}s")
+                        return lyrics
+                launch_next = True
+            if unavailable:
+                raise LyricsUnavailable(f"No lyrics for {title}, but {', '.join(unavailable)} could not answer")
+            return None
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._save_stats()
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import shutil
+
+# ------------------------------------------------
+# Content-addressed cache for rendered media
+# ------------------------------------------------
+# Entries are keyed by a hash of everything that goes into a render (text,
+# template, artwork, audio, encode profile), so a repeat post can reuse the
+# encoded video instead of drawing and encoding it again.
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "media_cache")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render_key(**inputs):
+    """Stable key for a render from its inputs (strings, numbers or content hashes)."""
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+    return hash_bytes(payload.encode("utf-8"))
+
+
+def cache_path(key, ext):
+    return os.path.join(MEDIA_CACHE_DIR, key[:2], f"{key}{ext}")
+
+
+def lookup(key, ext=".mp4"):
+    path = cache_path(key, ext)
+    if not os.path.isfile(path):
+        return None
+    # Touch on hit so eviction drops the least recently used entries first
+    os.utime(path)
+    return path
+
+
+def store(key, src_path, ext=".mp4"):
+    path = cache_path(key, ext)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    shutil.copyfile(src_path, tmp_path)
+    os.replace(tmp_path, path)
+    evict(keep=path)
+    return path
+
+
+def store_bytes(key, data, ext=".png"):
+    path = cache_path(key, ext)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    evict(keep=path)
+    return path
+
+
+def evict(max_bytes=None, keep=None):
+    max_bytes = MEDIA_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for root, _, files in os.walk(MEDIA_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    print(f"🧹 Evicted {removed} entries from media cache")
+    return removed
@@ -0,0 +1,250 @@
+import os
+import re
+from io import BytesIO
+
+from PIL import Image
+
+import media_cache
+from encoding import x264_args
+from ffmpeg_utils import media_info, run_ffmpeg
+from job_context import job_workdir
+
+# ------------------------------------------------
+# Media preflight
+# ------------------------------------------------
+# Twitter only reports a bad file after the upload, and for video only
+# after the processing wait. Every file is checked locally against the
+# upload limits first. Files that fail are remuxed or transcoded to fit,
+# and a file that cannot be fixed is rejected before any upload starts.
+# Fixed copies go into the media cache, keyed by the source file, the limits
+# and the encode profile, so a retried post does not transcode again.
+VIDEO_LIMITS = {
+    "max_bytes": 512 * 1024 ** 2,
+    "min_duration": 0.5,
+    "max_duration": 140,
+    "min_side": 32,
+    "max_width": 1280,
+    "max_height": 1024,
+    "max_aspect": 3.0,
+    "max_fps": 40,
+    "video_codec": "h264",
+    "pix_fmt": "yuv420p",
+    "audio_codec": "aac",
+    "audio_profile": "LC",
+    "sample_rates": (44100, 48000),
+    "max_channels": 2,
+}
+
+TWITTER_IMAGE_LIMIT = 5 * 1024 * 1024
+IMAGE_FORMATS = ("JPEG", "PNG", "GIF", "WEBP")
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+MAX_IMAGE_SIDE = 8192
+
+# Used when audio has to be re-encoded
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_BITRATE = "128k"
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+INPUT_RE = re.compile(r"Input #0, ([\w,]+?), from")
+DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+VIDEO_RE = re.compile(r"Stream #0:\d+.*?: Video: (\w+)(?: \(([^)]+)\))?.*?, (\w+)(?:\([^)]*\))?, (\d+)x(\d+)")
+FPS_RE = re.compile(r"(\d+(?:\.\d+)?) fps")
+AUDIO_RE = re.compile(r"Stream #0:\d+.*?: Audio: (\w+)(?: \(([^)]+)\))?.*?(\d+) Hz, ([^,\n]+)")
+CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2}
+
+
+class PreflightError(Exception):
+    pass
+
+
+def probe(path):
+    """Container, duration, size and first video/audio stream of `path`."""
+    text = media_info(path)
+    container = INPUT_RE.search(text)
+    if not container:
+        raise PreflightError(f"ffmpeg cannot read {path}")
+    duration = DURATION_RE.search(text)
+    info = {
+        "format": container.group(1).split(","),
+        "duration": int(duration.group(1)) * 3600 + int(duration.group(2)) * 60 + float(duration.group(3)) if duration else None,
+        "size": os.path.getsize(path),
+        "video": None,
+        "audio": None,
+    }
+    video = VIDEO_RE.search(text)
+    if video:
+        line = text[video.start():text.find("\n", video.start())]
+        fps = FPS_RE.search(line)
+        info["video"] = {
+            "codec": video.group(1),
+            "profile": video.group(2),
+            "pix_fmt": video.group(3),
+            "width": int(video.group(4)),
+            "height": int(video.group(5)),
+            "fps": float(fps.group(1)) if fps else None,
+        }
+    audio = AUDIO_RE.search(text)
+    if audio:
+        layout = audio.group(4).strip()
+        counted = re.match(r"(\d+) channels", layout)
+        # Any other named layout (2.1, quad, 5.1(side), ...) is more than stereo
+        channels = int(counted.group(1)) if counted else CHANNEL_LAYOUTS.get(layout, 3)
+        info["audio"] = {
+            "codec": audio.group(1),
+            "profile": audio.group(2),
+            "sample_rate": int(audio.group(3)),
+            "channels": channels,
+        }
+    return info
+
+
+def video_problems(info, limits=VIDEO_LIMITS):
+    """[(kind, reason)]; kind says what would fix it: container, video, audio, trim or fatal."""
+    problems = []
+    if "mp4" not in info["format"]:
+        problems.append(("container", f"container {','.join(info['format'])}"))
+
+    video = info["video"]
+    if not video:
+        return problems + [("fatal", "no video stream")]
+    if video["codec"] != limits["video_codec"]:
+        problems.append(("video", f"video codec {video['codec']}"))
+    if video["pix_fmt"] != limits["pix_fmt"]:
+        problems.append(("video", f"pixel format {video['pix_fmt']}"))
+    width, height = video["width"], video["height"]
+    if min(width, height) < limits["min_side"]:
+        problems.append(("fatal", f"resolution {width}x{height} below {limits['min_side']}px"))
+    elif max(width, height) / min(width, height) > limits["max_aspect"]:
+        problems.append(("fatal", f"aspect ratio {width}x{height}"))
+    elif width > limits["max_width"] or height > limits["max_height"] or width % 2 or height % 2:
+        problems.append(("video", f"resolution {width}x{height}"))
+    if video["fps"] and video["fps"] > limits["max_fps"]:
+        problems.append(("video", f"frame rate {video['fps']:g}"))
+
+    audio = info["audio"]
+    if audio:
+        if audio["codec"] != limits["audio_codec"] or (audio["profile"] or limits["audio_profile"]) != limits["audio_profile"]:
+            problems.append(("audio", f"audio codec {audio['codec']} {audio['profile'] or ''}".strip()))
+        if audio["sample_rate"] not in limits["sample_rates"]:
+            problems.append(("audio", f"sample rate {audio['sample_rate']} Hz"))
+        if audio["channels"] > limits["max_channels"]:
+            problems.append(("audio", f"{audio['channels']} audio channels"))
+
+    duration = info["duration"]
+    if duration is None or duration < limits["min_duration"]:
+        problems.append(("fatal", f"duration {duration}"))
+    elif duration > limits["max_duration"]:
+        problems.append(("trim", f"duration {duration:.1f}s"))
+    if info["size"] > limits["max_bytes"]:
+        problems.append(("video", f"file size {info['size'] // 2**20} MiB"))
+    return problems
+
+
+def fix_video(path, kinds, output_path, limits=VIDEO_LIMITS, profile=None):
+    """Remux when only the container is off; otherwise re-encode just the streams that need it."""
+    args = ["-i", path, "-map", "0:v:0", "-map", "0:a:0?"]
+    if "video" in kinds:
+        scale = (f"scale='min({limits['max_width']},iw)':'min({limits['max_height']},ih)'"
+                 ":force_original_aspect_ratio=decrease,scale=trunc(iw/2)*2:trunc(ih/2)*2,setsar=1")
+        args += ["-vf", scale, *x264_args(profile), "-fpsmax", str(limits["max_fps"])]
+    else:
+        args += ["-c:v", "copy"]
+    if "audio" in kinds:
+        args += ["-c:a", "aac", "-profile:a", "aac_low", "-ar", str(AUDIO_SAMPLE_RATE), "-ac", "2", "-b:a", AUDIO_BITRATE]
+    else:
+        args += ["-c:a", "copy"]
+    if "trim" in kinds:
+        args += ["-t", str(limits["max_duration"])]
+    run_ffmpeg([*args, "-movflags", "+faststart", output_path])
+    return output_path
+
+
+def preflight_video(path, limits=VIDEO_LIMITS, profile=None):
+    """Path of a video Twitter will accept: `path` itself, or a fixed copy from the media cache."""
+    problems = video_problems(probe(path), limits)
+    if not problems:
+        return path
+    reasons = "; ".join(reason for _, reason in problems)
+    kinds = {kind for kind, _ in problems}
+    if "fatal" in kinds:
+        raise PreflightError(f"{path} cannot be posted: {reasons}")
+
+    cache_key = media_cache.render_key(stage="preflight", source=media_cache.hash_file(path),
+                                       limits=limits, profile=profile)
+    cached = media_cache.lookup(cache_key)
+    if cached:
+        print(f"♻️ Reusing preflighted copy of {os.path.basename(path)}: {cached}")
+        return cached
+
+    action = "Remuxing" if kinds == {"container"} else "Transcoding"
+    print(f"🛠️ {action} {os.path.basename(path)} before upload: {reasons}")
+    with job_workdir(prefix="preflight-") as job:
+        fixed_path = fix_video(path, kinds, job.path("preflight.mp4"), limits, profile)
+        remaining = video_problems(probe(fixed_path), limits)
+        if remaining:
+            raise PreflightError(f"{path} still cannot be posted: {'; '.join(reason for _, reason in remaining)}")
+        return media_cache.store(cache_key, fixed_path)
+
+
+def shrink_image(data, limit=TWITTER_IMAGE_LIMIT):
+    """Downscale and recompress an image as JPEG until it fits under `limit` bytes."""
+    img = Image.open(BytesIO(data))
+    img = img.convert("RGB")
+    img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+    quality = 90
+    while True:
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+        if out.tell() <= limit:
+            print(f"🗜️ Recompressed image to {out.tell() // 1024} KiB ({img.width}x{img.height}, q={quality})")
+            return out.getvalue()
+        if quality > 70:
+            quality -= 10
+        else:
+            img = img.resize((int(img.width * 0.75), int(img.height * 0.75)), Image.LANCZOS)
+
+
+def image_extension(data):
+    """File extension matching the format of the image bytes; uploads are typed by it."""
+    with Image.open(BytesIO(data)) as img:
+        return FORMAT_EXTENSIONS.get(img.format, ".jpg")
+
+
+def preflight_image_bytes(data, limit=TWITTER_IMAGE_LIMIT):
+    """Image bytes Twitter will accept: `data` itself, or a recompressed JPEG."""
+    try:
+        with Image.open(BytesIO(data)) as img:
+            img.verify()
+        with Image.open(BytesIO(data)) as img:
+            image_format, size = img.format, img.size
+    except Exception as e:
+        raise PreflightError(f"Not a readable image: {e}")
+    if image_format not in IMAGE_FORMATS:
+        reason = f"format {image_format}"
+    elif len(data) > limit:
+        reason = f"{len(data) // 1024} KiB"
+    elif max(size) > MAX_IMAGE_SIDE:
+        reason = f"{size[0]}x{size[1]}"
+    else:
+        return data
+    print(f"🛠️ Converting image before upload: {reason}")
+    return shrink_image(data, limit)
+
+
+def preflight(path, profile=None):
+    """Check the file at `path` before upload; returns the path to upload."""
+    if not path.lower().endswith(IMAGE_EXTENSIONS):
+        return preflight_video(path, profile=profile)
+    with open(path, "rb") as f:
+        data = f.read()
+    cache_key = media_cache.render_key(stage="preflight", source=media_cache.hash_bytes(data),
+                                       limit=TWITTER_IMAGE_LIMIT)
+    cached = media_cache.lookup(cache_key, ".jpg")
+    if cached:
+        print(f"♻️ Reusing preflighted copy of {os.path.basename(path)}: {cached}")
+        return cached
+    fixed = preflight_image_bytes(data)
+    if fixed is data:
+        return path
+    return media_cache.store_bytes(cache_key, fixed, ".jpg")
@@ -0,0 +1,36 @@
+# ------------------------------------------------
+# Media resource lifecycle
+# ------------------------------------------------
+# moviepy clips hold ffmpeg reader subprocesses and file handles until they
+# are closed, and nothing closes them on an exception. Every clip created
+# while rendering is registered with a MediaScope, which closes them all
+# (newest first) when the block exits, however it exits.
+
+
+class MediaScope:
+    def __init__(self):
+        self._resources = []
+
+    def add(self, resource):
+        """Register anything with a close() method; returns it for chaining."""
+        self._resources.append(resource)
+        return resource
+
+    def close(self):
+        while self._resources:
+            resource = self._resources.pop()
+            try:
+                resource.close()
+            except Exception as e:
+                print(f"⚠️ Error closing {type(resource).__name__}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def media_scope():
+    return MediaScope()
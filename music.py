@@ -5,13 +5,25 @@ import random
 from dotenv import load_dotenv
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
-from moviepy.audio.io.AudioFileClip import AudioFileClip
-from moviepy.video.VideoClip import ImageClip
 import time
 import lyricsgenius
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 import re
+import argparse
+from encoding import ENCODE_PROFILES, DEFAULT_PROFILE
+from video_render import render_still_video, render_keyframe_video
+from lyric_animation import line_layers, composite, reveal_keyframes
+import media_cache
+import outbox
+import catalog
+from lyrics_router import LyricsRouter
+from title_index import similarity
+import itunes
+from job_context import job_workdir, image_to_png
+from deadline import posting_deadline, StageTimeout
+import snippet_cache
+import media_preflight
 
 # Load Environment Variables
 load_dotenv()
@@ -48,23 +60,31 @@ client = tweepy.Client(
     bearer_token=BEARER_TOKEN
 )
 
-# Paths
-IMAGE_OUTPUT = "lyric_image.png"
-AUDIO_OUTPUT = "hook_trimmed.mp3"
+# Scratch file names inside each job's work directory
 VIDEO_OUTPUT = "lyric_video.mp4"
+OUTBOX_DB = "music_outbox.db"
+SNIPPET_CACHE = "music_snippets.json"
+LYRICS_STATS_FILE = "music_provider_stats.json"
+
+# Bump whenever generate_lyric_image or create_video changes what they draw,
+# so cached videos from the old layout are not reused
+TEMPLATE_VERSION = "hourlykingofpop-720p-v2"
 
 # Constants for video dimensions
 VIDEO_SIZE = (1280, 720)
 
-def fetch_mj_song():
+def fetch_mj_song(deadline=None):
     try:
-        # Search for Michael Jackson's tracks using Spotify
-        results = sp.search(q='artist:Michael Jackson', type='track', limit=50)
-        if not results['tracks']['items']:
+        # Full Spotify discography, synced locally and refreshed weekly
+        artist = "Michael Jackson"
+        tracks = catalog.get_catalog("spotify", artist,
+                                     lambda current: catalog.sync_spotify_catalog(sp, artist, current),
+                                     deadline=deadline)
+        if not tracks['tracks']:
             raise Exception("No tracks found for Michael Jackson.")
         
-        # Randomly pick a song
-        random_track = random.choice(results['tracks']['items'])
+        # Pick a song weighted by Spotify popularity
+        random_track = catalog.weighted_choice("spotify", tracks, catalog.spotify_weight)
         song_title = random_track['name']
         print(f"Selected Song: {song_title} by Michael Jackson")
         return song_title
@@ -72,38 +92,38 @@ def fetch_mj_song():
         print(f"Error fetching song: {e}")
         return None
 
+def fetch_lyrics_genius(artist, song_title):
+    song = genius.search_song(song_title, artist)
+    # Genius returns its closest match; reject it if it is a different song
+    if song and song.lyrics and similarity(song.title, song_title) >= 0.5:
+        return song.lyrics
+    return None
+
+def fetch_lyrics_ovh(artist, song_title):
+    sanitized_artist = artist.replace(' ', '%20')
+    url = f"https://api.lyrics.ovh/v1/{sanitized_artist}/{song_title}"
+    response = requests.get(url, timeout=10)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    data = response.json()
+    if "lyrics" in data and data["lyrics"].strip():
+        return data["lyrics"]
+    return None
+
+# Provider order adapts to each provider's hit rate and latency
+lyrics_router = LyricsRouter([
+    ("genius", fetch_lyrics_genius),
+    ("lyrics.ovh", fetch_lyrics_ovh),
+], LYRICS_STATS_FILE)
+
 def fetch_lyrics(song_title, artist):
-    # Try Genius API first
-    try:
-        song = genius.search_song(song_title, artist)
-        if song and song.lyrics:
-            # Clean up the lyrics
-            lyrics = clean_lyrics(song.lyrics)
-            print("Lyrics fetched from Genius API.")
-            return lyrics
-        else:
-            raise Exception("Genius API did not return lyrics.")
-    except Exception as e:
-        print(f"Error fetching lyrics from Genius API: {e}")
-        print("Trying Lyrics.ovh API...")
-    
-    # Fallback to Lyrics.ovh API
-    try:
-        sanitized_artist = artist.replace(' ', '%20')
-        url = f"https://api.lyrics.ovh/v1/{sanitized_artist}/{song_title}"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if "lyrics" in data and data["lyrics"].strip():
-            # Clean up the lyrics
-            lyrics = clean_lyrics(data["lyrics"])
-            print("Lyrics fetched from Lyrics.ovh API.")
-            return lyrics
-        else:
-            raise Exception("Lyrics.ovh API did not return lyrics.")
-    except Exception as e:
-        print(f"Error fetching lyrics from Lyrics.ovh API: {e}")
-    
+    # Ask providers for the canonical catalog title, not the release variant
+    canonical = catalog.title_index("spotify", artist).canonical(song_title)
+    lyrics = lyrics_router.fetch(artist, canonical)
+    if lyrics:
+        # Clean up the lyrics
+        return clean_lyrics(lyrics)
     print("Unable to fetch lyrics from any source.")
     return None
 
@@ -142,12 +162,9 @@ def clean_lyrics(lyrics):
 def fetch_album_cover(song_title, artist):
     try:
         # Use iTunes API for album cover
-        url = f"https://itunes.apple.com/search?term={artist}+{song_title}&media=music&limit=1"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if data['resultCount'] > 0:
-            return data['results'][0]['artworkUrl100']
+        track = itunes.lookup_track(song_title, artist)
+        if track and track.get('artworkUrl100'):
+            return track['artworkUrl100']
         else:
             raise Exception("Album cover not found.")
     except Exception as e:
@@ -156,172 +173,338 @@ def fetch_album_cover(song_title, artist):
 
 def fetch_audio_preview(song_title, artist):
     try:
-        # Use iTunes API for audio preview
-        url = f"https://itunes.apple.com/search?term={artist}+{song_title}&media=music&limit=1"
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if data['resultCount'] > 0:
-            return data['results'][0]['previewUrl']
+        # Use iTunes API for audio preview (same cached search as the cover)
+        track = itunes.lookup_track(song_title, artist)
+        if track and track.get('previewUrl'):
+            return track['previewUrl']
         else:
             raise Exception("Audio preview not found.")
     except Exception as e:
         print(f"Error fetching audio preview: {e}")
     return None
 
-def generate_lyric_image(song_title, artist, lyrics, album_cover_url=None):
-    try:
-        # Clean the lyrics before processing
-        cleaned_lyrics = clean_lyrics(lyrics)
-        
-        # Create image with black background for video size
-        img = Image.new("RGB", VIDEO_SIZE, color="black")
-        draw = ImageDraw.Draw(img)
-
-        # Load Fonts
-        title_font = ImageFont.truetype("Roboto-Bold.ttf", 80)
-        artist_font = ImageFont.truetype("Roboto-Regular.ttf", 60)
-        lyrics_font = ImageFont.truetype("Roboto-Bold.ttf", 70)
-        branding_font = ImageFont.truetype("Roboto-Italic.ttf", 40)
-
-        # Positioning for 720p aspect ratio
-        draw.text((640, 50), song_title, font=title_font, fill="white", anchor="mm", align="center")
-        draw.text((640, 150), artist, font=artist_font, fill="grey", anchor="mm", align="center")
-
-        def wrap_text(text, font, max_width):
-            """Word wrapping."""
-            lines = []
-            words = text.split()
-            current_line = []
-            for word in words:
-                test_line = ' '.join(current_line + [word])
-                if draw.textlength(test_line, font=font) <= max_width:
-                    current_line.append(word)
-                else:
-                    lines.append(' '.join(current_line))
-                    current_line = [word]
-            if current_line:
+def render_card_layers(song_title, artist, lyrics, album_cover_url=None, album_cover_data=None):
+    # The card without lyrics, plus one transparent layer per wrapped lyric line.
+    # Clean the lyrics before processing
+    cleaned_lyrics = clean_lyrics(lyrics)
+    
+    # Create image with black background for video size
+    img = Image.new("RGB", VIDEO_SIZE, color="black")
+    draw = ImageDraw.Draw(img)
+
+    # Load Fonts
+    title_font = ImageFont.truetype("Roboto-Bold.ttf", 80)
+    artist_font = ImageFont.truetype("Roboto-Regular.ttf", 60)
+    lyrics_font = ImageFont.truetype("Roboto-Bold.ttf", 70)
+    branding_font = ImageFont.truetype("Roboto-Italic.ttf", 40)
+
+    # Positioning for 720p aspect ratio
+    draw.text((640, 50), song_title, font=title_font, fill="white", anchor="mm", align="center")
+    draw.text((640, 150), artist, font=artist_font, fill="grey", anchor="mm", align="center")
+
+    def wrap_text(text, font, max_width):
+        """Word wrapping."""
+        lines = []
+        words = text.split()
+        current_line = []
+        for word in words:
+            test_line = ' '.join(current_line + [word])
+            if draw.textlength(test_line, font=font) <= max_width:
+                current_line.append(word)
+            else:
                 lines.append(' '.join(current_line))
-            return '\n'.join(lines)
-
-        # Wrap the lyrics to fit within the image dimensions
-        wrapped_lyrics = wrap_text(cleaned_lyrics, lyrics_font, 1100)
-        draw.multiline_text((640, 350), wrapped_lyrics, font=lyrics_font, fill="white", anchor="mm", align="center")
-
-        draw.text((1110, 640), "@hourlykingofpop", font=branding_font, fill="white", anchor="mm")
-        if album_cover_url:
-            response = requests.get(album_cover_url)
-            album_cover = Image.open(BytesIO(response.content)).resize((150, 150))
-            img.paste(album_cover, (50, 550))
-        img.save(IMAGE_OUTPUT)
-        return IMAGE_OUTPUT
+                current_line = [word]
+        if current_line:
+            lines.append(' '.join(current_line))
+        return '\n'.join(lines)
+
+    # Wrap the lyrics to fit within the image dimensions
+    wrapped_lyrics = wrap_text(cleaned_lyrics, lyrics_font, 1100)
+    lyric_layers = line_layers(VIDEO_SIZE, wrapped_lyrics.split('\n'), lyrics_font, (640, 350), "white")
+
+    draw.text((1110, 640), "@hourlykingofpop", font=branding_font, fill="white", anchor="mm")
+    if album_cover_url and album_cover_data is None:
+        album_cover_data = requests.get(album_cover_url, timeout=10).content
+    if album_cover_data:
+        album_cover = Image.open(BytesIO(album_cover_data)).resize((150, 150))
+        img.paste(album_cover, (50, 550))
+    return img, lyric_layers
+
+def generate_lyric_image(song_title, artist, lyrics, album_cover_url=None, album_cover_data=None):
+    try:
+        img, lyric_layers = render_card_layers(song_title, artist, lyrics, album_cover_url, album_cover_data)
+        return image_to_png(composite(img, lyric_layers))
     except Exception as e:
         print(f"Error generating image: {e}")
         return None
 
-def create_video(image_path, audio_path, output_path, duration=15):
+def generate_lyric_keyframes(song_title, artist, lyrics, album_cover_url=None, album_cover_data=None, duration=15):
+    # Animated card: the lyric lines appear one at a time. Each line is drawn
+    # once and a frame is composited only when a new line appears. Returns the
+    # fully revealed card as well, for the image-only fallback
     try:
-        image_clip = ImageClip(image_path).with_duration(duration).resized(VIDEO_SIZE)
-        audio_clip = AudioFileClip(audio_path).subclipped(0, min(duration, 140))
-        video = image_clip.with_audio(audio_clip)
-
-        video.write_videofile(output_path, 
-                              codec="libx264", 
-                              audio_codec="aac", 
-                              fps=30, 
-                              bitrate="5000k")
-        
+        img, lyric_layers = render_card_layers(song_title, artist, lyrics, album_cover_url, album_cover_data)
+        return image_to_png(composite(img, lyric_layers)), reveal_keyframes(img, lyric_layers, duration)
+    except Exception as e:
+        print(f"Error generating keyframes: {e}")
+        return None, None
+
+def create_video(image, audio, output_path, duration=15, profile=None, keyframes=None):
+    try:
+        if keyframes:
+            # Only the frames where a new line appears are encoded
+            render_keyframe_video(keyframes, audio, output_path, duration, profile,
+                                  size=VIDEO_SIZE, audio_duration=min(duration, 140))
+        else:
+            # Clips and encoder scratch files are released even when encoding fails
+            render_still_video(image, audio, output_path, duration, profile,
+                               size=VIDEO_SIZE, audio_duration=min(duration, 140))
+
         print("Video created successfully.")
     except Exception as e:
         print(f"Error creating video: {e}")
         return False
     return True
 
-def tweet_video(song_title, artist):
+def download_album_cover(song_title, artist):
+    album_cover = fetch_album_cover(song_title, artist)
+    print(f"Album cover URL: {album_cover}")
+    return requests.get(album_cover, timeout=10).content if album_cover else None
+
+def download_audio_preview(song_title, artist):
+    audio_preview = fetch_audio_preview(song_title, artist)
+    print(f"Audio preview URL: {audio_preview}")
+    return requests.get(audio_preview, timeout=10).content if audio_preview else None
+
+def render_video(image, audio_data, cache_key, profile, keyframes=None):
+    # Runs under the render budget; an overrun render that completes before
+    # the run's deadline (see Deadline.settle) still lands in the media cache
+    with job_workdir() as job:
+        output_path = job.path(VIDEO_OUTPUT)
+        if create_video(image, audio_data, output_path, profile=profile, keyframes=keyframes):
+            return media_cache.store(cache_key, output_path)
+    print("Failed to create video.")
+    return None
+
+def upload_media(media_path, profile=None):
+    # Image-only fallback posts upload the PNG card; everything else is a video
+    category = 'tweet_image' if media_path.endswith(".png") else 'tweet_video'
+    # Catch anything Twitter would reject before paying for the upload
+    media_path = media_preflight.preflight(media_path, profile)
+    m1 = api.media_upload(
+        media_path,
+        media_category=category
+    )
+    media_id = m1.media_id_string
+    print(f"Media uploaded successfully. Media ID: {media_id}")
+    return media_id, getattr(m1, 'expires_after_secs', None)
+
+def wait_for_processing(media_id, deadline, fallback=False):
+    budget = deadline.budget("processing", fallback)
+    give_up_at = time.monotonic() + budget
+    status = api.get_media_upload_status(media_id)
+    processing_info = getattr(status, 'processing_info', None)
+    state = processing_info.get('state') if processing_info else "succeeded"
+    while state != "succeeded":
+        if state == "failed":
+            raise Exception("Media processing failed.")
+        wait_time = processing_info.get('check_after_secs', 5)
+        if time.monotonic() + wait_time > give_up_at:
+            raise StageTimeout("processing", budget)
+        print(f"Media still processing. Waiting {wait_time} seconds...")
+        time.sleep(wait_time)
+        status = api.get_media_upload_status(media_id)
+        processing_info = getattr(status, 'processing_info', None)
+        state = processing_info.get('state') if processing_info else "succeeded"
+
+    print("Media processing completed successfully.")
+
+def create_tweet(tweet_text, media_id, deadline, fallback=False):
+    max_retries = 5
+    retry_delay = 60
+    
+    for attempt in range(max_retries):
+        try:
+            response = client.create_tweet(
+                text=tweet_text,
+                media_ids=[media_id]
+            )
+            tweet_id = response.data['id']
+            print(f"Tweeted successfully: https://twitter.com/user/status/{tweet_id}")
+            return tweet_id
+        except tweepy.errors.TooManyRequests as e:
+            reset_time = int(e.response.headers.get("x-rate-limit-reset", time.time() + retry_delay))
+            wait_time = max(reset_time - time.time(), retry_delay)
+            if wait_time > deadline.budget("tweet", fallback):
+                # Leave the post in the outbox for the next run instead of sleeping past the slot
+                print(f"Rate limit resets in {int(wait_time)} seconds, past the posting deadline.")
+                return None
+            print(f"Rate limit exceeded. Retrying in {int(wait_time)} seconds...")
+            time.sleep(wait_time)
+        except Exception as e:
+            print(f"Error tweeting: {e}")
+            if attempt == max_retries - 1:  # Last attempt
+                return None
+    return None
+
+def publish_entry(outbox_db, entry, deadline, fallback=False, profile=None):
+    # Images need no media processing; fallback posts may use the reserved time
+    is_video = not entry["media_path"].endswith(".png")
+    return outbox.publish(
+        outbox_db, entry,
+        lambda media_path: deadline.run("upload", upload_media, media_path, profile, fallback=fallback),
+        lambda text, media_id: create_tweet(text, media_id, deadline, fallback),
+        (lambda media_id: wait_for_processing(media_id, deadline, fallback)) if is_video else None,
+    )
+
+def media_rejected(e):
+    # The media itself cannot go out (failed preflight, still processing at
+    # the budget), so a cheaper post should take the slot. Anything else,
+    # like a rate limit, is left pending in the outbox for the next run.
+    return isinstance(e, media_preflight.PreflightError) or (isinstance(e, StageTimeout) and e.stage == "processing")
+
+def tweet_media(song_title, artist, media_path, outbox_db, post_key, deadline, fallback=False, profile=None):
+    # Raises when media_rejected(); otherwise returns whether the post went out
+    tweet_text = f"{song_title} by {artist}\n#MJ #Kingofpop"
     try:
-        m1 = api.media_upload(
-            VIDEO_OUTPUT,
-            media_category='tweet_video'
-        )
-        media_id = m1.media_id_string
-        print(f"Video uploaded successfully. Media ID: {media_id}")
-
-        processing_info = getattr(m1, 'processing_info', None)
-        if processing_info:
-            state = processing_info.get('state')
-            while state != "succeeded":
-                if state == "failed":
-                    raise Exception("Media processing failed.")
-                wait_time = processing_info.get('check_after_secs', 5)
-                print(f"Media still processing. Waiting {wait_time} seconds...")
-                time.sleep(wait_time)
-                status = api.get_status(m1.media_id)
-                processing_info = getattr(status, 'processing_info', None)
-                state = processing_info.get('state') if processing_info else "succeeded"
-
-        print("Media processing completed successfully.")
-        
-        tweet_text = f"{song_title} by {artist}\n#MJ #Kingofpop"
-        
-        max_retries = 5
-        retry_delay = 60
-        
-        for attempt in range(max_retries):
-            try:
-                response = client.create_tweet(
-                    text=tweet_text,
-                    media_ids=[media_id]
-                )
-                tweet_id = response.data['id']
-                print(f"Video tweeted successfully: https://twitter.com/user/status/{tweet_id}")
-                return True
-            except tweepy.errors.TooManyRequests as e:
-                reset_time = int(e.response.headers.get("x-rate-limit-reset", time.time() + retry_delay))
-                wait_time = max(reset_time - time.time(), retry_delay)
-                print(f"Rate limit exceeded. Retrying in {int(wait_time)} seconds...")
-                time.sleep(wait_time)
-            except Exception as e:
-                print(f"Error tweeting video: {e}")
-                if attempt == max_retries - 1:  # Last attempt
-                    return False
+        entry = outbox.enqueue(outbox_db, post_key, tweet_text, media_path)
+        return publish_entry(outbox_db, entry, deadline, fallback, profile) is not None
     except Exception as e:
-        print(f"Unexpected error tweeting video: {e}")
+        if media_rejected(e):
+            raise
+        print(f"Unexpected error tweeting: {e}")
     return False
 
-if __name__ == "__main__":
+def resume_pending_posts(outbox_db, deadline, profile=None):
+    # A post that failed after rendering or uploading is finished before
+    # starting a new one, reusing its media_id if it is still valid
+    for entry in outbox.pending(outbox_db):
+        print(f"Resuming pending post ({entry['state']}): {entry['text']!r}")
+        try:
+            if publish_entry(outbox_db, entry, deadline, profile=profile):
+                return True
+        except Exception as e:
+            print(f"Error resuming pending post: {e}")
+    return False
+
+def post_new_video(profile, outbox_db, deadline, animate=False):
     artist = "Michael Jackson"
-    song_title = fetch_mj_song()
-    
-    if song_title:
-        lyrics = fetch_lyrics(song_title, artist)
-        album_cover = fetch_album_cover(song_title, artist)
-        audio_preview = fetch_audio_preview(song_title, artist)
-
-        print(f"Album cover URL: {album_cover}")
-        print(f"Audio preview URL: {audio_preview}")
-
-        if lyrics and album_cover and audio_preview:
-            try:
-                # Generate Lyric Image
-                image_path = generate_lyric_image(song_title, artist, lyrics, album_cover)
-                if image_path:
-                    # Download the audio preview
-                    response = requests.get(audio_preview)
-                    with open(AUDIO_OUTPUT, 'wb') as f:
-                        f.write(response.content)
-                    
-                    # Create the video
-                    if create_video(image_path, AUDIO_OUTPUT, VIDEO_OUTPUT):
-                        # Post the video on Twitter
-                        if not tweet_video(song_title, artist):
-                            print("Failed to tweet video.")
-                    else:
-                        print("Failed to create video.")
-                else:
-                    print("Failed to generate image.")
-            except Exception as e:
-                print(f"An error occurred during execution: {e}")
+    song_title = fetch_mj_song(deadline)
+    if not song_title:
+        print("No song title obtained.")
+        return
+
+    # Each stage runs under its own budget; when one overruns, fall back to
+    # something cheaper rather than miss the slot
+    try:
+        lyrics = deadline.run("lyrics", fetch_lyrics, song_title, artist)
+    except Exception as e:
+        print(f"Lyrics unavailable: {e}")
+        lyrics = None
+    if lyrics:
+        snippet_cache.remember(SNIPPET_CACHE, artist, song_title, lyrics)
+    else:
+        cached = snippet_cache.fallback(SNIPPET_CACHE, artist, song_title)
+        if not cached:
+            print("No lyrics and no cached snippet to fall back on.")
+            return
+        song_title, lyrics = cached
+        print(f"Using a cached snippet from {song_title}")
+
+    try:
+        album_cover_data = deadline.run("artwork", download_album_cover, song_title, artist)
+    except Exception as e:
+        print(f"Artwork unavailable: {e}")
+        album_cover_data = None
+    if not album_cover_data:
+        print("Using the default card without album art.")
+        album_cover_data = b""
+
+    try:
+        audio_data = deadline.run("audio", download_audio_preview, song_title, artist)
+    except Exception as e:
+        print(f"Audio preview unavailable: {e}")
+        audio_data = None
+
+    video_path = None
+    image = None
+    if audio_data:
+        # The artwork and audio hashes key the media cache
+        cache_key = media_cache.render_key(
+            template=TEMPLATE_VERSION,
+            song_title=song_title,
+            artist=artist,
+            lyrics=lyrics,
+            artwork=media_cache.hash_bytes(album_cover_data),
+            audio=media_cache.hash_bytes(audio_data),
+            profile=profile,
+            animated=animate,
+        )
+        video_path = media_cache.lookup(cache_key)
+        if video_path:
+            print(f"Reusing cached video: {video_path}")
         else:
-            print("Missing necessary resources: lyrics, album cover, or audio preview.")
+            # Only a cache miss pays for drawing the card
+            if animate:
+                image, keyframes = generate_lyric_keyframes(song_title, artist, lyrics, album_cover_data=album_cover_data)
+            else:
+                image, keyframes = generate_lyric_image(song_title, artist, lyrics, album_cover_data=album_cover_data), None
+            if not image:
+                print("Failed to generate image.")
+            else:
+                try:
+                    video_path = deadline.run("render", render_video, BytesIO(image.getvalue()),
+                                              audio_data, cache_key, profile, keyframes)
+                except Exception as e:
+                    print(f"Video not ready in time: {e}")
+
+    post_key = None
+    if video_path:
+        # Each attempt gets its own outbox entry; retries resume it
+        post_key = f"{cache_key}:{int(time.time())}"
+        try:
+            if not tweet_media(song_title, artist, video_path, outbox_db, post_key, deadline, profile=profile):
+                print("Video post left in the outbox for the next run.")
+            return
+        except Exception as e:
+            print(f"Video cannot be posted: {e}")
+
+    # Image-only fallback: the card needs no encoding or media processing
+    print("Falling back to an image-only tweet.")
+    if image is None:
+        image = generate_lyric_image(song_title, artist, lyrics, album_cover_data=album_cover_data)
+        if not image:
+            print("Failed to generate image.")
+            return
+    card_hash = media_cache.hash_bytes(image.getvalue())
+    card_path = media_cache.store_bytes(card_hash, image.getvalue(), ".png")
+    try:
+        tweeted = tweet_media(song_title, artist, card_path, outbox_db, f"{card_hash}:{int(time.time())}",
+                              deadline, fallback=True)
+    except Exception as e:
+        print(f"Image cannot be posted: {e}")
+        tweeted = False
+    if not tweeted:
+        print("Failed to tweet image.")
+    elif post_key:
+        # The image-only post filled this slot; don't post the video next run too
+        outbox.abandon(outbox_db, post_key)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post a Michael Jackson lyric video.")
+    parser.add_argument("--profile", choices=sorted(ENCODE_PROFILES), default=DEFAULT_PROFILE,
+                        help="Encode profile for the lyric video")
+    parser.add_argument("--animate", action="store_true",
+                        help="Reveal the lyric lines one at a time instead of a static card")
+    args = parser.parse_args()
+
+    # The whole run, including any resumed post, has to fit the hourly slot
+    deadline = posting_deadline()
+    outbox_db = outbox.open_outbox(OUTBOX_DB)
+    if resume_pending_posts(outbox_db, deadline, args.profile):
+        print("Posted a pending video from the outbox; no new song this run.")
     else:
-        print("No song title obtained.")
+        post_new_video(args.profile, outbox_db, deadline, args.animate)
+    # An overrun render may still finish into the media cache for the next post;
+    # its ffmpeg and work directory are cleaned up at exit if it does not
+    deadline.settle(("render",))
@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import time
+
+from state_store import transaction
+
+# ------------------------------------------------
+# Tweet outbox
+# ------------------------------------------------
+# Each post moves through rendered -> uploaded -> processed -> tweeted, and
+# every step is written down before the next one starts. A rerun picks up at
+# the last completed step and reuses the uploaded media_id while Twitter
+# still accepts it, instead of rendering and uploading again.
+OUTBOX_DB = os.getenv("OUTBOX_DB", "outbox.db")
+
+# Twitter keeps uploaded media for 24h; leave room for the tweet call itself
+DEFAULT_MEDIA_TTL = 24 * 60 * 60
+EXPIRY_MARGIN = 10 * 60
+
+# Entries that keep failing (bad text, rejected media) are given up on
+MAX_ATTEMPTS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    post_key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    media_path TEXT NOT NULL,
+    meta TEXT,
+    state TEXT NOT NULL,
+    media_id TEXT,
+    media_expires_at REAL,
+    tweet_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, created_at);
+"""
+
+COLUMNS = ("post_key", "text", "media_path", "meta", "state", "media_id",
+           "media_expires_at", "tweet_id", "attempts", "created_at", "updated_at")
+
+
+def open_outbox(path=OUTBOX_DB):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _row_to_entry(row):
+    if row is None:
+        return None
+    entry = dict(zip(COLUMNS, row))
+    entry["meta"] = json.loads(entry["meta"]) if entry["meta"] else {}
+    return entry
+
+
+def get(conn, post_key):
+    row = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM outbox WHERE post_key = ?", (post_key,)).fetchone()
+    return _row_to_entry(row)
+
+
+def enqueue(conn, post_key, text, media_path, meta=None):
+    """Record a rendered post; an existing entry for the same key is returned unchanged."""
+    now = time.time()
+    with transaction(conn):
+        conn.execute(
+            "INSERT OR IGNORE INTO outbox (post_key, text, media_path, meta, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'rendered', ?, ?)",
+            (post_key, text, media_path, json.dumps(meta or {}), now, now),
+        )
+    return get(conn, post_key)
+
+
+def pending(conn):
+    """Unfinished entries, oldest first, that can still be completed."""
+    rows = conn.execute(
+        f"SELECT {', '.join(COLUMNS)} FROM outbox "
+        "WHERE state NOT IN ('tweeted', 'abandoned') ORDER BY created_at"
+    ).fetchall()
+    entries = [_row_to_entry(row) for row in rows]
+    return [e for e in entries if media_id_valid(e) or os.path.isfile(e["media_path"])]
+
+
+def media_id_valid(entry):
+    return bool(entry["media_id"]) and (entry["media_expires_at"] or 0) > time.time() + EXPIRY_MARGIN
+
+
+def _update(conn, post_key, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with transaction(conn):
+        conn.execute(f"UPDATE outbox SET {assignments} WHERE post_key = ?", (*fields.values(), post_key))
+
+
+def mark_uploaded(conn, post_key, media_id, expires_after=None):
+    expires_at = time.time() + (expires_after or DEFAULT_MEDIA_TTL)
+    _update(conn, post_key, state="uploaded", media_id=str(media_id), media_expires_at=expires_at)
+
+
+def mark_processed(conn, post_key):
+    _update(conn, post_key, state="processed")
+
+
+def mark_tweeted(conn, post_key, tweet_id):
+    _update(conn, post_key, state="tweeted", tweet_id=str(tweet_id))
+
+
+def record_failure(conn, post_key):
+    with transaction(conn):
+        conn.execute(
+            "UPDATE outbox SET attempts = attempts + 1, updated_at = ?, "
+            "state = CASE WHEN attempts + 1 >= ? THEN 'abandoned' ELSE state END "
+            "WHERE post_key = ?",
+            (time.time(), MAX_ATTEMPTS, post_key),
+        )
+
+
+def abandon(conn, post_key):
+    """Give up on an entry, e.g. because a fallback post filled its slot."""
+    _update(conn, post_key, state="abandoned")
+
+
+def publish(conn, entry, upload, create_tweet, wait_for_processing=None):
+    """Drive an outbox entry to 'tweeted', skipping every step that already completed.
+
+    `upload(media_path)` returns (media_id, expires_after_secs or None),
+    `wait_for_processing(media_id)` raises if Twitter rejects the media, and
+    `create_tweet(text, media_id)` returns the tweet ID or None. Returns the
+    tweet ID, or None if the post is still pending.
+    """
+    post_key = entry["post_key"]
+    if entry["state"] == "tweeted":
+        return entry["tweet_id"]
+
+    try:
+        if entry["state"] != "rendered" and not media_id_valid(entry):
+            print(f"⌛ Media {entry['media_id']} expired, uploading again")
+            entry["state"] = "rendered"
+
+        media_id = entry["media_id"]
+        if entry["state"] == "rendered":
+            media_id, expires_after = upload(entry["media_path"])
+            mark_uploaded(conn, post_key, media_id, expires_after)
+            entry["state"] = "uploaded"
+        else:
+            print(f"♻️ Reusing uploaded media {media_id}")
+
+        if entry["state"] == "uploaded":
+            if wait_for_processing:
+                wait_for_processing(media_id)
+            mark_processed(conn, post_key)
+
+        tweet_id = create_tweet(entry["text"], media_id)
+    except Exception:
+        record_failure(conn, post_key)
+        raise
+
+    if not tweet_id:
+        record_failure(conn, post_key)
+        return None
+    mark_tweeted(conn, post_key, tweet_id)
+    return tweet_id
@@ -0,0 +1,47 @@
+import json
+import os
+import random
+
+# ------------------------------------------------
+# Last known good lyric snippets
+# ------------------------------------------------
+# Every snippet that made it onto a card is kept per song, so a post whose
+# lyrics lookup is slow or comes back empty can still go out with a snippet
+# from an earlier run instead of missing its slot.
+MAX_SNIPPETS_PER_SONG = 5
+
+
+def load_snippets(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not read snippet cache {path}: {e}")
+        return {}
+
+
+def remember(path, artist, song_title, snippet):
+    snippets = load_snippets(path)
+    song_key = f"{artist}|{song_title}"
+    known = [s for s in snippets.get(song_key, []) if s != snippet]
+    snippets[song_key] = ([snippet] + known)[:MAX_SNIPPETS_PER_SONG]
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snippets, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def fallback(path, artist, song_title):
+    """(song_title, snippet) from the cache: this song if known, else any song by `artist`."""
+    snippets = load_snippets(path)
+    known = snippets.get(f"{artist}|{song_title}")
+    if known:
+        return song_title, random.choice(known)
+    others = [(key.split("|", 1)[1], values) for key, values in snippets.items()
+              if key.startswith(f"{artist}|") and values]
+    if not others:
+        return None
+    title, values = random.choice(others)
+    return title, random.choice(values)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Soak test for the render pipeline: render many lyric videos in one process
+# and fail if memory, open file descriptors or child processes keep growing.
+#
+#   python soak_render.py --iterations 300
+#
+# Linux only (reads /proc/self).
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import wave
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Keep the soak's audio cache out of the real media cache
+os.environ.setdefault("MEDIA_CACHE_DIR", tempfile.mkdtemp(prefix="soak-cache-"))
+os.environ.setdefault("HOOKS_DB", os.path.join(os.environ["MEDIA_CACHE_DIR"], "hooks.db"))
+
+from job_context import job_workdir, image_to_png  # noqa: E402
+from video_render import render_still_video  # noqa: E402
+
+VIDEO_SIZE = (1280, 720)
+SAMPLE_RATE = 44100
+
+
+def rss_bytes():
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def child_processes():
+    pid = str(os.getpid())
+    children = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # fields[0] is the state, fields[1] the parent pid; zombies count too
+        if fields[1] == pid:
+            children += 1
+    return children
+
+
+def synthetic_card(i):
+    img = Image.new("RGB", VIDEO_SIZE, color="black")
+    draw = ImageDraw.Draw(img)
+    draw.text((640, 50), f"Soak Song {i}", fill="white", anchor="mm")
+    draw.multiline_text((640, 350), f"line {i}\nanother line", fill="white", anchor="mm", align="center")
+    return image_to_png(img)
+
+
+def synthetic_preview(seed, seconds=30):
+    """A WAV preview as bytes; a new seed means a new track (cold audio cache)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    tone = 0.2 * np.sin(2 * np.pi * rng.uniform(200, 800) * t) * (1 + np.sin(2 * np.pi * 0.5 * t)) / 2
+    pcm = (np.stack([tone, tone], axis=-1) * 32767).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render many videos in one process and check for leaks.")
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=10, help="Renders before the baseline is taken")
+    parser.add_argument("--tracks", type=int, default=20, help="Distinct audio previews to cycle through")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--profile", default="fast")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=50)
+    parser.add_argument("--max-fd-growth", type=int, default=2)
+    args = parser.parse_args()
+
+    previews = [synthetic_preview(seed) for seed in range(args.tracks)]
+    baseline = None
+    failures = 0
+    for i in range(args.warmup + args.iterations):
+        with job_workdir(prefix="soak-") as job:
+            try:
+                render_still_video(synthetic_card(i), previews[i % len(previews)], job.path("soak.mp4"),
+                                   duration=args.duration, profile=args.profile, size=VIDEO_SIZE, logger=None)
+            except Exception as e:
+                failures += 1
+                print(f"❌ Render {i} failed: {e}")
+        if i + 1 == args.warmup:
+            baseline = (rss_bytes(), open_fds())
+            print(f"📏 Baseline after {args.warmup} renders: RSS {baseline[0] / 2**20:.1f} MiB, {baseline[1]} fds")
+        if baseline and (i + 1 - args.warmup) % 50 == 0:
+            print(f"🔁 {i + 1 - args.warmup} renders: RSS {rss_bytes() / 2**20:.1f} MiB, "
+                  f"{open_fds()} fds, {child_processes()} children")
+
+    rss_growth = (rss_bytes() - baseline[0]) / 2**20
+    fd_growth = open_fds() - baseline[1]
+    children = child_processes()
+    print(f"📊 RSS growth {rss_growth:.1f} MiB, fd growth {fd_growth}, children {children}, failures {failures}")
+
+    ok = True
+    if rss_growth > args.max_rss_growth_mb:
+        print(f"❌ RSS grew by more than {args.max_rss_growth_mb} MiB")
+        ok = False
+    if fd_growth > args.max_fd_growth:
+        print(f"❌ Open file descriptors grew by more than {args.max_fd_growth}")
+        ok = False
+    if children:
+        print("❌ ffmpeg child processes left behind")
+        ok = False
+    if failures:
+        print("❌ Some renders failed")
+        ok = False
+    print("✅ Soak passed" if ok else "❌ Soak failed")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, re, time, random, requests, tweepy, sys, json
+import os, re, time, random, requests, tweepy, sys, json, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from dotenv import load_dotenv
 from bs4 import BeautifulSoup
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+import state_store
+import outbox
+from lyrics_router import LyricsRouter, LyricsUnavailable
+from title_index import TitleIndex
+from deadline import posting_deadline, StageTimeout
+import snippet_cache
+import media_preflight
+from media_preflight import TWITTER_IMAGE_LIMIT
 
 load_dotenv()
 
@@ -23,6 +33,16 @@ GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID")  # Google Custom Search Engine ID
 USED_SONGS_FILE = "used_songs.txt"
 NO_LYRICS_FILE = "no_lyrics_songs.txt"
 RECORDINGS_FILE = "recordings.json"
+OUTBOX_DB = "song_outbox.db"
+IMAGE_CACHE_DIR = "image_cache"
+IMAGE_CACHE_INDEX = "image_cache.json"
+SNIPPET_CACHE = "song_snippets.json"
+LYRICS_STATS_FILE = "song_provider_stats.json"
+DEFAULT_IMAGE_QUERY = "Michael Jackson"
+# A failed tweet is retried on the same outbox entry, reusing its uploaded image
+PUBLISH_ATTEMPTS = 3
+PUBLISH_RETRY_DELAY = 30
+
 
 SKIP_TITLE_KEYWORDS = [
     "remix", "version", "edit", "live", "instrumental", "karaoke",
@@ -40,72 +60,106 @@ print("✅ API credentials loaded successfully")
 def normalize_title(title):
     return re.sub(r'\s+', ' ', re.sub(r'[^a-z0-9 ]+', '', title.lower())).strip()
 
-def load_used_songs(filename):
-    if not os.path.isfile(filename):
-        print(f"⚠️ {filename} not found, starting with empty used songs list")
-        return set()
-    with open(filename, "r", encoding="utf-8") as f:
-        used = {line.strip() for line in f}
-        print(f"📖 Loaded {len(used)} used songs from {filename}")
-        return used
-
-def save_used_song(filename, title_key):
-    with open(filename, "a", encoding="utf-8") as f:
-        f.write(title_key + "\n")
-    print(f"💾 Saved song to used_songs: {title_key}")
-
-def load_no_lyrics(filename):
-    if not os.path.isfile(filename):
-        print(f"⚠️ {filename} not found, starting with empty no lyrics list")
-        return set()
-    with open(filename, "r", encoding="utf-8") as f:
-        no_lyrics = {line.strip() for line in f}
-        print(f"📖 Loaded {len(no_lyrics)} no lyrics songs from {filename}")
-        return no_lyrics
-
-def save_no_lyrics(filename, title_key):
-    with open(filename, "a", encoding="utf-8") as f:
-        f.write(title_key + "\n")
-    print(f"💾 Saved song to no_lyrics: {title_key}")
-
 # --- Image Fetching ---
 
-def fetch_mj_image(query="Michael Jackson"):
-    print(f"🖼️ Fetching image for query: {query}")
+_cse_service = None
+
+def get_cse_service():
+    # Building the discovery client is slow; do it once per process
+    global _cse_service
+    if _cse_service is None:
+        _cse_service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY, cache_discovery=False)
+    return _cse_service
+
+def load_image_cache():
+    if not os.path.isfile(IMAGE_CACHE_INDEX):
+        return {}
+    with open(IMAGE_CACHE_INDEX, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_image_cache(cache):
+    tmp_path = f"{IMAGE_CACHE_INDEX}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, IMAGE_CACHE_INDEX)
+
+def probe_image(url):
+    """HEAD an image URL; returns its size in bytes (0 if unknown) or None if unusable."""
     try:
-        # Initialize Google Custom Search API
-        service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
-        result = service.cse().list(
-            q=query,
-            cx=GOOGLE_CSE_ID,
-            searchType="image",  # Restrict to image search
-            num=3  # Fetch 3 images to choose from
-        ).execute()
-        
-        images = result.get("items", [])
-        if not images:
-            print("⚠️ No images found via Google CSE")
+        resp = requests.head(url, headers={"User-Agent": USER_AGENT}, timeout=5, allow_redirects=True)
+        if resp.status_code != 200:
             return None
-        
-        # Select a random image
-        image_url = random.choice(images)["link"]
-        print(f"✅ Found image: {image_url}")
-        
-        # Download the image
-        img_resp = requests.get(image_url, headers={"User-Agent": USER_AGENT}, timeout=5)
-        img_resp.raise_for_status()
-        img_path = "temp_mj_image.jpg"
-        with open(img_path, "wb") as f:
-            f.write(img_resp.content)
-        print(f"💾 Downloaded image to {img_path}")
-        
-        # Verify file size (Twitter limit: 5MB)
-        if os.path.getsize(img_path) > 5 * 1024 * 1024:
-            print("⚠️ Image too large for Twitter (>5MB)")
-            os.remove(img_path)
+        content_type = resp.headers.get("Content-Type", "")
+        if content_type and not content_type.startswith("image/"):
             return None
-            
-        return img_path
+        return int(resp.headers.get("Content-Length") or 0)
+    except Exception:
+        return None
+
+def download_first_compliant(urls):
+    # Probe every candidate at once, then walk them in preference order:
+    # known-small images first, then anything reachable (to be shrunk)
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        sizes = list(pool.map(probe_image, urls))
+    candidates = [(size > TWITTER_IMAGE_LIMIT, url) for url, size in zip(urls, sizes) if size is not None]
+    candidates.sort(key=lambda c: c[0])
+    for _, url in candidates:
+        try:
+            img_resp = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=5)
+            img_resp.raise_for_status()
+        except Exception as e:
+            print(f"⚠️ Image download failed for {url}: {e}")
+            continue
+        # Format, dimensions and size are checked here, not after the upload
+        try:
+            data = media_preflight.preflight_image_bytes(img_resp.content)
+        except Exception as e:
+            print(f"⚠️ Unusable image {url}: {e}")
+            continue
+        print(f"✅ Found image: {url}")
+        return data
+    return None
+
+def image_cache_path(query, data):
+    # Preflight keeps PNG, GIF and WEBP as they are, so the extension follows the bytes
+    return os.path.join(IMAGE_CACHE_DIR, hashlib.sha256(query.encode("utf-8")).hexdigest() + media_preflight.image_extension(data))
+
+def fetch_mj_image(query="Michael Jackson"):
+    print(f"🖼️ Fetching image for query: {query}")
+    try:
+        cache = load_image_cache()
+        cached = cache.get(query)
+        if not (cached and os.path.isfile(cached)):
+            result = get_cse_service().cse().list(
+                q=query,
+                cx=GOOGLE_CSE_ID,
+                searchType="image",  # Restrict to image search
+                num=10  # Same quota cost as fewer results, more fallbacks
+            ).execute()
+
+            images = result.get("items", [])
+            if not images:
+                print("⚠️ No images found via Google CSE")
+                return None
+
+            urls = [item["link"] for item in images]
+            random.shuffle(urls)
+            data = download_first_compliant(urls)
+            if not data:
+                print("⚠️ No usable image among search results")
+                return None
+
+            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+            cached = image_cache_path(query, data)
+            with open(cached, "wb") as f:
+                f.write(data)
+            cache[query] = cached
+            save_image_cache(cache)
+            return data
+
+        print(f"♻️ Using cached image for query: {query}")
+        with open(cached, "rb") as f:
+            return f.read()
     except HttpError as e:
         print(f"❌ Google CSE API error: {e}")
         return None
@@ -113,6 +167,14 @@ def fetch_mj_image(query="Michael Jackson"):
         print(f"❌ Image fetch error: {e}")
         return None
 
+def default_image():
+    # Default art: the generic artist image, read only from the cache so it is instant
+    cached = load_image_cache().get(DEFAULT_IMAGE_QUERY)
+    if cached and os.path.isfile(cached):
+        with open(cached, "rb") as f:
+            return f.read()
+    return None
+
 # --- Recordings Fetch & Cache ---
 
 def fetch_and_cache_recordings():
@@ -158,51 +220,50 @@ def load_recordings():
 
 # --- Lyrics fetching ---
 
+# Providers return None when they have no lyrics for a song and raise when
+# the request itself failed, so the router can tell misses from outages.
+
 def fetch_lyrics_primary(artist, title):
     normalized_title = normalize_title(title)
     url = f"https://api.lyrics.ovh/v1/{artist}/{normalized_title}"
     print(f"🎵 Fetching lyrics (primary) for: {artist} - {title} (URL: {url})")
-    try:
-        resp = requests.get(url, timeout=5)
-        if resp.status_code != 200:
-            print(f"⚠️ Lyrics API (primary) returned status {resp.status_code} for {title}")
-            return None
-        lyrics = resp.json().get("lyrics")
-        if not lyrics:
-            print(f"⚠️ No lyrics found (primary) for {title}")
-        return lyrics
-    except Exception as e:
-        print(f"❌ Lyrics API (primary) error for {title}: {e}")
+    resp = requests.get(url, timeout=5)
+    if resp.status_code == 404:
+        print(f"⚠️ Lyrics API (primary) has no lyrics for {title}")
         return None
+    resp.raise_for_status()
+    lyrics = resp.json().get("lyrics")
+    if not lyrics:
+        print(f"⚠️ No lyrics found (primary) for {title}")
+    return lyrics
 
 def fetch_lyrics_fallback(artist, title):
     az_title = re.sub(r'[^a-z0-9]', '', title.lower())
     url = f"https://www.azlyrics.com/lyrics/{artist.lower().replace(' ', '')}/{az_title}.html"
     print(f"🎵 Fetching lyrics (fallback) for: {artist} - {title} (URL: {url})")
-    try:
-        resp = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=5)
-        if resp.status_code != 200:
-            print(f"⚠️ Lyrics fallback returned status {resp.status_code} for {title}")
-            return None
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        ringtone = soup.find("div", class_="ringtone")
-        if ringtone:
-            lyrics_div = ringtone.find_next_sibling("div")
-            if lyrics_div:
-                lyrics = lyrics_div.text.strip()
-                if lyrics:
-                    return lyrics
-        print(f"⚠️ No lyrics found (fallback) for {title}")
-        return None
-    except Exception as e:
-        print(f"❌ Lyrics fallback error for {title}: {e}")
+    resp = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=5)
+    if resp.status_code == 404:
+        print(f"⚠️ Lyrics fallback has no page for {title}")
         return None
+    resp.raise_for_status()
+    soup = BeautifulSoup(resp.text, 'html.parser')
+    ringtone = soup.find("div", class_="ringtone")
+    if ringtone:
+        lyrics_div = ringtone.find_next_sibling("div")
+        if lyrics_div:
+            lyrics = lyrics_div.text.strip()
+            if lyrics:
+                return lyrics
+    print(f"⚠️ No lyrics found (fallback) for {title}")
+    return None
+
+lyrics_router = LyricsRouter([
+    ("lyrics.ovh", fetch_lyrics_primary),
+    ("azlyrics", fetch_lyrics_fallback),
+], LYRICS_STATS_FILE)
 
 def fetch_lyrics(artist, title):
-    lyrics = fetch_lyrics_primary(artist, title)
-    if lyrics:
-        return lyrics
-    return fetch_lyrics_fallback(artist, title)
+    return lyrics_router.fetch(artist, title)
 
 # --- Processing lyrics ---
 
@@ -236,7 +297,7 @@ def select_snippet(lines):
 
 # --- Twitter ---
 
-def tweet_lyric_with_image(text, image_path):
+def twitter_clients():
     client = tweepy.Client(
         consumer_key=API_KEY,
         consumer_secret=API_SECRET,
@@ -251,31 +312,93 @@ def tweet_lyric_with_image(text, image_path):
         access_token=ACCESS_TOKEN,
         access_token_secret=ACCESS_TOKEN_SECRET
     )
-    api = tweepy.API(auth)
-    
-    print(f"📤 Attempting to tweet: {text} with image: {image_path}")
-    try:
-        # Upload media
-        media = api.media_upload(image_path)
-        # Post tweet with media
-        client.create_tweet(text=text, media_ids=[media.media_id])
-        print("✅ Tweet with image posted successfully")
-        # Clean up temporary image file
-        if os.path.exists(image_path):
-            os.remove(image_path)
-            print(f"🗑️ Removed temporary image: {image_path}")
-        return True
-    except Exception as e:
-        print(f"❌ Tweepy error: {e}")
-        return False
+    return client, tweepy.API(auth)
+
+def publish_entry(outbox_db, entry, deadline, image_data=None):
+    client, api = twitter_clients()
+
+    def upload(media_path):
+        # Upload straight from memory; on a resumed post read the cached image
+        data = image_data
+        if data is None:
+            with open(media_path, "rb") as f:
+                data = f.read()
+        # A no-op for fresh downloads; catches images cached before the preflight existed
+        data = media_preflight.preflight_image_bytes(data)
+        # tweepy picks the media type (and chunked upload for GIFs) from the filename
+        media = api.media_upload(filename=f"image{media_preflight.image_extension(data)}", file=BytesIO(data))
+        print(f"📤 Uploaded image ({len(data) // 1024} KiB), media ID {media.media_id_string}")
+        return media.media_id_string, getattr(media, "expires_after_secs", None)
+
+    def create_tweet(text, media_id):
+        response = client.create_tweet(text=text, media_ids=[media_id])
+        return str(response.data["id"])
+
+    # An image tweet is already the cheapest post, so it may use the reserved time
+    def upload_in_budget(media_path):
+        return deadline.run("upload", upload, media_path, fallback=True)
+
+    return outbox.publish(outbox_db, entry, upload_in_budget, create_tweet)
+
+def tweet_lyric_with_image(text, image_data, media_path, outbox_db, post_key, meta, deadline):
+    """Publish the post, retrying on its outbox entry; returns the tweet ID or None if it is still pending."""
+    print(f"📤 Attempting to tweet: {text} with image ({len(image_data) // 1024} KiB)")
+    outbox.enqueue(outbox_db, post_key, text, media_path, meta)
+    for attempt in range(1, PUBLISH_ATTEMPTS + 1):
+        # Reload so a retry skips the upload that already went through
+        entry = outbox.get(outbox_db, post_key)
+        if entry["state"] == "abandoned":
+            break
+        wait_time = PUBLISH_RETRY_DELAY
+        try:
+            tweet_id = publish_entry(outbox_db, entry, deadline, image_data)
+            if tweet_id:
+                print(f"✅ Tweet with image posted successfully: {tweet_id}")
+                return tweet_id
+            print(f"⚠️ Tweet not posted (attempt {attempt}/{PUBLISH_ATTEMPTS})")
+        except tweepy.errors.TooManyRequests as e:
+            reset_time = int(e.response.headers.get("x-rate-limit-reset", time.time() + PUBLISH_RETRY_DELAY))
+            wait_time = max(reset_time - time.time(), PUBLISH_RETRY_DELAY)
+            print(f"⚠️ Rate limited (attempt {attempt}/{PUBLISH_ATTEMPTS})")
+        except Exception as e:
+            print(f"❌ Tweepy error (attempt {attempt}/{PUBLISH_ATTEMPTS}): {e}")
+        if attempt == PUBLISH_ATTEMPTS:
+            break
+        if wait_time > deadline.budget("tweet", fallback=True):
+            print(f"⏰ Next retry in {int(wait_time)} seconds is past the posting deadline")
+            break
+        print(f"🔁 Retrying in {int(wait_time)} seconds...")
+        time.sleep(wait_time)
+    return None
+
+def resume_pending_posts(outbox_db, store, deadline):
+    # Finish a post that failed after its image was uploaded before picking a new song
+    for entry in outbox.pending(outbox_db):
+        print(f"🔁 Resuming pending post ({entry['state']}): {entry['text']!r}")
+        try:
+            tweet_id = publish_entry(outbox_db, entry, deadline)
+        except Exception as e:
+            print(f"❌ Error resuming pending post: {e}")
+            continue
+        if tweet_id:
+            meta = entry["meta"]
+            state_store.record_post(store, meta["title_key"], entry["text"], meta["media_hash"], tweet_id)
+            return True
+    return False
 
 # --- Main ---
 
 def main():
     print("🚀 Starting MJ Tweet Bot")
-    used_songs = load_used_songs(USED_SONGS_FILE)
-    no_lyrics_songs = load_no_lyrics(NO_LYRICS_FILE)
+    store = state_store.open_store(used_file=USED_SONGS_FILE, no_lyrics_file=NO_LYRICS_FILE)
+    outbox_db = outbox.open_outbox(OUTBOX_DB)
     random.seed()
+    # The run has to fill the hourly slot on time, however slow the providers are
+    deadline = posting_deadline()
+
+    if resume_pending_posts(outbox_db, store, deadline):
+        print("🏁 Posted a pending tweet from the outbox; no new song this run")
+        return
 
     recordings = load_recordings()
     if not recordings:
@@ -283,6 +406,7 @@ def main():
         return
 
     print(f"🔢 Total recordings: {len(recordings)}")
+    titles = TitleIndex(recordings)
 
     # Filter usable songs
     possible = []
@@ -290,52 +414,100 @@ def main():
         if any(key in title.lower() for key in SKIP_TITLE_KEYWORDS):
             continue
         key = normalize_title(title)
-        if key in used_songs or key in no_lyrics_songs:
+        if state_store.is_used(store, key) or state_store.has_no_lyrics(store, key):
             continue
         possible.append(title)
     
     if not possible:
         print("🔄 No more unused songs with lyrics available. Resetting used songs list.")
-        open(USED_SONGS_FILE, "w").close()
-        used_songs = set()
-        possible = [t for t in recordings if normalize_title(t) not in no_lyrics_songs]
+        state_store.start_new_cycle(store, state_store.current_cycle(store))
+        possible = [t for t in recordings if not state_store.has_no_lyrics(store, normalize_title(t))]
 
     random.shuffle(possible)
 
     for title in possible:
+        if deadline.expired():
+            print("⏰ Posting deadline reached, giving up on this run")
+            break
         print(f"🎵 Processing song: {title}")
         key = normalize_title(title)
 
-        # Fetch lyrics
-        lyrics = fetch_lyrics("Michael Jackson", title)
-        if not lyrics:
-            print(f"⚠️ No lyrics found for {title}, marking as no lyrics")
-            save_no_lyrics(NO_LYRICS_FILE, key)
+        # Reserve the song so a parallel worker cannot post it too
+        if not state_store.claim_song(store, key):
+            print(f"⏭️ {title} was posted or claimed by another worker, skipping")
             continue
 
-        # Select tweet snippet
-        snippet = select_snippet(clean_lyrics(lyrics))
-        if not snippet:
-            print(f"⚠️ No valid snippet for {title}, moving to next song")
+        # Fetch lyrics
+        # Query providers with the canonical title rather than the recording's variant name
+        snippet = None
+        try:
+            lyrics = deadline.run("lyrics", fetch_lyrics, "Michael Jackson", titles.canonical(title))
+        except (StageTimeout, LyricsUnavailable) as e:
+            # Slow or failing providers are not a miss: never mark no-lyrics here,
+            # but reuse a snippet posted for this song before, if any
+            cached = snippet_cache.fallback(SNIPPET_CACHE, "Michael Jackson", title)
+            if not (cached and cached[0] == title):
+                state_store.release_claim(store, key)
+                if not lyrics_router.ordered():
+                    print(f"🚫 Every lyrics provider is unavailable ({e}), stopping this run")
+                    break
+                print(f"⏰ Lyrics for {title} unavailable ({e}), moving to next song")
+                continue
+            print(f"♻️ Using a cached snippet for {title}")
+            snippet = cached[1]
+        except Exception as e:
+            print(f"❌ Lyrics lookup for {title} failed ({e}), moving to next song")
+            state_store.release_claim(store, key)
             continue
 
+        if snippet is None:
+            if not lyrics:
+                print(f"⚠️ No lyrics found for {title}, marking as no lyrics")
+                state_store.mark_no_lyrics(store, key)
+                state_store.release_claim(store, key)
+                continue
+
+            # Select tweet snippet
+            snippet = select_snippet(clean_lyrics(lyrics))
+            if not snippet:
+                print(f"⚠️ No valid snippet for {title}, moving to next song")
+                state_store.release_claim(store, key)
+                continue
+            snippet_cache.remember(SNIPPET_CACHE, "Michael Jackson", title, snippet)
+
         # Fetch image
-        image_path = fetch_mj_image(f"Michael Jackson {title}")
-        if not image_path:
+        query = f"Michael Jackson {title}"
+        try:
+            image_data = deadline.run("artwork", fetch_mj_image, query)
+        except StageTimeout:
+            print("🖼️ Image search too slow, using the default image")
+            query = DEFAULT_IMAGE_QUERY
+            image_data = default_image()
+        if not image_data:
             print(f"⚠️ No image found for {title}, skipping to next song")
+            state_store.release_claim(store, key)
             continue
 
+        media_hash = hashlib.sha256(image_data).hexdigest()
+
         # Tweet with image
-        if tweet_lyric_with_image(snippet, image_path):
-            save_used_song(USED_SONGS_FILE, key)
+        post_key = f"{key}:{media_hash}:{int(time.time())}"
+        meta = {"title_key": key, "media_hash": media_hash}
+        # Images cached before the extension followed the format keep their old path
+        media_path = load_image_cache().get(query) or image_cache_path(query, image_data)
+        tweet_id = tweet_lyric_with_image(snippet, image_data, media_path, outbox_db, post_key, meta, deadline)
+        if tweet_id:
+            state_store.record_post(store, key, snippet, media_hash, tweet_id)
             print(f"🎉 Successfully tweeted for {title}")
             break
+        if outbox.get(outbox_db, post_key)["state"] == "abandoned":
+            print(f"❌ Gave up on tweeting {title}")
+            state_store.release_claim(store, key)
         else:
-            print(f"❌ Failed to tweet for {title}, moving to next song")
-            # Clean up image if tweet failed
-            if os.path.exists(image_path):
-                os.remove(image_path)
-                print(f"🗑️ Removed temporary image: {image_path}")
+            # Keep the claim: the post stays pending in the outbox and the next
+            # run finishes it with the uploaded image instead of starting over
+            print(f"📥 Could not tweet {title}; left in the outbox for the next run")
+        break
 
     print("🏁 Script completed")
 
@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# ------------------------------------------------
+# Posting state (SQLite)
+# ------------------------------------------------
+# Replaces used_songs.txt / no_lyrics_songs.txt. Every lookup goes through an
+# index, and writes are transactions, so several workers can share one file.
+# A "cycle" is one pass through the catalog: resetting the used list starts
+# a new cycle instead of deleting history.
+STATE_DB = os.getenv("STATE_DB", "bot_state.db")
+
+# A claim older than this belongs to a worker that died mid-post
+CLAIM_TTL = 30 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    title_key TEXT NOT NULL,
+    cycle INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    snippet TEXT,
+    media_hash TEXT,
+    tweet_id TEXT,
+    claimed_at REAL,
+    posted_at REAL,
+    UNIQUE (title_key, cycle)
+);
+CREATE INDEX IF NOT EXISTS posts_tweet_id ON posts (tweet_id);
+CREATE TABLE IF NOT EXISTS no_lyrics (
+    title_key TEXT PRIMARY KEY,
+    marked_at REAL NOT NULL
+);
+"""
+
+
+@contextmanager
+def transaction(conn):
+    # BEGIN IMMEDIATE takes the write lock up front, so read-check-write
+    # sequences cannot interleave between workers
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def open_store(path=STATE_DB, used_file=None, no_lyrics_file=None):
+    """Open (and if needed create) the state database, importing legacy text files once."""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(SCHEMA)
+    with transaction(conn):
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('cycle', '0')")
+        migrated = conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone()
+        if not migrated:
+            _import_legacy(conn, path, used_file, no_lyrics_file)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', '1')")
+    return conn
+
+
+def _read_lines(filename):
+    if not filename or not os.path.isfile(filename):
+        return []
+    with open(filename, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _import_legacy(conn, path, used_file, no_lyrics_file):
+    now = time.time()
+    used = _read_lines(used_file)
+    no_lyrics = _read_lines(no_lyrics_file)
+    conn.executemany(
+        "INSERT OR IGNORE INTO posts (title_key, cycle, status, posted_at) VALUES (?, 0, 'posted', ?)",
+        [(key, now) for key in used],
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO no_lyrics (title_key, marked_at) VALUES (?, ?)",
+        [(key, now) for key in no_lyrics],
+    )
+    if used or no_lyrics:
+        print(f"📦 Imported {len(used)} used and {len(no_lyrics)} no lyrics songs into {path}")
+
+
+def current_cycle(conn):
+    return int(conn.execute("SELECT value FROM meta WHERE key = 'cycle'").fetchone()[0])
+
+
+def is_used(conn, title_key):
+    row = conn.execute(
+        "SELECT status, claimed_at FROM posts WHERE title_key = ? AND cycle = ?",
+        (title_key, current_cycle(conn)),
+    ).fetchone()
+    if not row:
+        return False
+    status, claimed_at = row
+    return status == "posted" or (claimed_at or 0) > time.time() - CLAIM_TTL
+
+
+def has_no_lyrics(conn, title_key):
+    return conn.execute("SELECT 1 FROM no_lyrics WHERE title_key = ?", (title_key,)).fetchone() is not None
+
+
+def claim_song(conn, title_key):
+    """Reserve a song for this worker; returns False if it is posted or claimed elsewhere."""
+    now = time.time()
+    with transaction(conn):
+        cycle = current_cycle(conn)
+        row = conn.execute(
+            "SELECT status, claimed_at FROM posts WHERE title_key = ? AND cycle = ?",
+            (title_key, cycle),
+        ).fetchone()
+        if row:
+            status, claimed_at = row
+            if status == "posted" or (claimed_at or 0) > now - CLAIM_TTL:
+                return False
+            conn.execute(
+                "UPDATE posts SET claimed_at = ? WHERE title_key = ? AND cycle = ?",
+                (now, title_key, cycle),
+            )
+        else:
+            conn.execute(
+                "INSERT INTO posts (title_key, cycle, status, claimed_at) VALUES (?, ?, 'claimed', ?)",
+                (title_key, cycle, now),
+            )
+    return True
+
+
+def release_claim(conn, title_key):
+    with transaction(conn):
+        conn.execute(
+            "DELETE FROM posts WHERE title_key = ? AND cycle = ? AND status = 'claimed'",
+            (title_key, current_cycle(conn)),
+        )
+
+
+def record_post(conn, title_key, snippet, media_hash, tweet_id):
+    with transaction(conn):
+        conn.execute(
+            "INSERT INTO posts (title_key, cycle, status, snippet, media_hash, tweet_id, posted_at) "
+            "VALUES (?, ?, 'posted', ?, ?, ?, ?) "
+            "ON CONFLICT (title_key, cycle) DO UPDATE SET status = 'posted', snippet = excluded.snippet, "
+            "media_hash = excluded.media_hash, tweet_id = excluded.tweet_id, posted_at = excluded.posted_at",
+            (title_key, current_cycle(conn), snippet, media_hash, tweet_id, time.time()),
+        )
+    print(f"💾 Recorded post for {title_key}: tweet {tweet_id}")
+
+
+def mark_no_lyrics(conn, title_key):
+    with transaction(conn):
+        conn.execute(
+            "INSERT OR IGNORE INTO no_lyrics (title_key, marked_at) VALUES (?, ?)",
+            (title_key, time.time()),
+        )
+    print(f"💾 Saved song to no_lyrics: {title_key}")
+
+
+def start_new_cycle(conn, expected_cycle):
+    """Begin a fresh pass through the catalog, unless another worker already did."""
+    with transaction(conn):
+        conn.execute(
+            "UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'cycle' AND value = ?",
+            (str(expected_cycle),),
+        )
+    return current_cycle(conn)
@@ -0,0 +1,91 @@
+import re
+from collections import Counter
+
+# ------------------------------------------------
+# Canonical song titles
+# ------------------------------------------------
+# Catalog titles carry release noise ("- 2003 Remaster", "(Single Version)",
+# "feat. ..."), and providers only know the plain title. Titles are reduced
+# to a canonical form, and a trigram index maps any variant or near-miss
+# spelling back to the best-known catalog title.
+VARIANT_WORDS = (
+    "remaster", "remastered", "version", "edit", "mix", "remix", "live", "mono",
+    "stereo", "single", "radio", "demo", "bonus", "acoustic", "instrumental",
+    "reprise", "feat", "ft", "featuring", "with", "from", "anniversary", "deluxe",
+)
+_VARIANT = "|".join(VARIANT_WORDS)
+
+# "(Single Version)", "[2001 Remaster]", "(feat. Slash)"
+_BRACKETED_VARIANT = re.compile(r"\s*[\(\[][^\)\]]*\b(?:" + _VARIANT + r")\b[^\)\]]*[\)\]]", re.IGNORECASE)
+# "Billie Jean - 2008 Remaster", "Thriller - Single Version"
+_DASHED_VARIANT = re.compile(r"\s+-\s+[^-]*\b(?:" + _VARIANT + r")\b.*$", re.IGNORECASE)
+# "Scream feat. Janet Jackson"
+_FEATURING = re.compile(r"\s+(?:feat\.?|ft\.?|featuring)\s+.*$", re.IGNORECASE)
+
+
+def strip_variants(title):
+    """The title as a provider would list it, with release/variant noise removed."""
+    stripped = _BRACKETED_VARIANT.sub("", title)
+    stripped = _DASHED_VARIANT.sub("", stripped)
+    stripped = _FEATURING.sub("", stripped)
+    return re.sub(r"\s+", " ", stripped).strip() or title.strip()
+
+
+def normalize(title):
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9 ]+", "", strip_variants(title).lower())).strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """Trigram Jaccard similarity of two titles' canonical forms (0..1)."""
+    ta, tb = trigrams(normalize(a)), trigrams(normalize(b))
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+class TitleIndex:
+    def __init__(self, titles):
+        self.titles = []
+        self.by_key = {}
+        self.postings = {}
+        for title in titles:
+            key = normalize(title)
+            if not key or key in self.by_key:
+                continue
+            idx = len(self.titles)
+            self.titles.append((key, strip_variants(title)))
+            self.by_key[key] = idx
+            for gram in trigrams(key):
+                self.postings.setdefault(gram, []).append(idx)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def match(self, query, min_score=0.5):
+        """Best catalog title for `query` as (title, score), or (None, 0.0)."""
+        key = normalize(query)
+        if key in self.by_key:
+            return self.titles[self.by_key[key]][1], 1.0
+        query_grams = trigrams(key)
+        hits = Counter()
+        for gram in query_grams:
+            hits.update(self.postings.get(gram, ()))
+        best, best_score = None, 0.0
+        for idx, shared in hits.items():
+            candidate_grams = len(trigrams(self.titles[idx][0]))
+            score = shared / (len(query_grams) + candidate_grams - shared)
+            if score > best_score:
+                best, best_score = idx, score
+        if best is None or best_score < min_score:
+            return None, 0.0
+        return self.titles[best][1], best_score
+
+    def canonical(self, title):
+        """The best-known provider-facing form of `title`."""
+        match, _ = self.match(title)
+        return match or strip_variants(title)
@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+from PIL import Image
+from moviepy.video.VideoClip import ImageClip
+
+from audio_engine import prepare_audio
+from encoding import get_encode_profile, write_videofile_kwargs, x264_args
+from ffmpeg_utils import mux, run_ffmpeg
+from media_resources import media_scope
+
+# ------------------------------------------------
+# Still-card video rendering
+# ------------------------------------------------
+
+# Longest a keyframe is held as a single frame; longer holds repeat it so
+# players and Twitter's transcoder still see a frame at least once a second
+MAX_FRAME_HOLD = 1.0
+
+
+def render_still_video(image, audio, output_path, duration=15, profile=None, size=(1280, 720), audio_duration=None, logger="bar"):
+    """Encode `image` (path or PNG buffer) over `audio` (path or bytes) into `output_path`.
+
+    The audio is prepared and encoded once per track by audio_engine and muxed
+    in with stream copy; only the video stream goes through moviepy. Every
+    clip is closed and the scratch video removed even if encoding fails.
+    """
+    workdir = os.path.dirname(output_path) or None
+    bitrate = get_encode_profile(profile)["audio_bitrate"]
+    processed_audio = prepare_audio(audio, audio_duration or duration, bitrate=bitrate, workdir=workdir)
+
+    video_only = f"{output_path}.video.mp4"
+    try:
+        with media_scope() as scope:
+            with Image.open(image) as img:
+                frame = np.array(img.convert("RGB"))
+            clip = scope.add(ImageClip(frame).with_duration(duration))
+            clip = scope.add(clip.resized(size))
+            clip.write_videofile(video_only, audio=False, logger=logger, **write_videofile_kwargs(profile))
+        mux(video_only, processed_audio, output_path)
+    finally:
+        if os.path.exists(video_only):
+            os.remove(video_only)
+    return output_path
+
+
+def encode_keyframes(keyframes, output_path, duration=15, profile=None, size=(1280, 720)):
+    """Encode [(start_time, image)] keyframes into a video-only file.
+
+    Each keyframe is written once and held until the next one through
+    ffmpeg's concat demuxer at a variable frame rate, so an animated card
+    costs a handful of frames rather than duration * fps of them.
+    """
+    list_path = f"{output_path}.frames.txt"
+    scratch = [list_path]
+    try:
+        entries = []
+        for i, (start, image) in enumerate(keyframes):
+            end = keyframes[i + 1][0] if i + 1 < len(keyframes) else duration
+            frame_path = f"{output_path}.frame{i}.png"
+            scratch.append(frame_path)
+            if isinstance(image, Image.Image):
+                image.convert("RGB").resize(size).save(frame_path, compress_level=1)
+            else:
+                with Image.open(image) as img:
+                    img.convert("RGB").resize(size).save(frame_path, compress_level=1)
+            hold = end - start
+            while hold > 1e-3:
+                step = min(hold, MAX_FRAME_HOLD)
+                entries.append(f"file '{os.path.abspath(frame_path)}'\nduration {step:.3f}")
+                hold -= step
+        # The concat demuxer ignores the last entry's duration unless the file is listed again
+        entries.append(entries[-1].split("\n")[0])
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(entries) + "\n")
+
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-vsync", "vfr",
+            *x264_args(profile),
+            "-an",
+            output_path,
+        ])
+    finally:
+        for path in scratch:
+            if os.path.exists(path):
+                os.remove(path)
+    return output_path
+
+
+def render_keyframe_video(keyframes, audio, output_path, duration=15, profile=None, size=(1280, 720), audio_duration=None):
+    """Encode [(start_time, image)] keyframes over `audio` (path or bytes) into `output_path`."""
+    workdir = os.path.dirname(output_path) or None
+    bitrate = get_encode_profile(profile)["audio_bitrate"]
+    processed_audio = prepare_audio(audio, audio_duration or duration, bitrate=bitrate, workdir=workdir)
+
+    video_only = f"{output_path}.video.mp4"
+    try:
+        encode_keyframes(keyframes, video_only, duration, profile, size)
+        mux(video_only, processed_audio, output_path)
+    finally:
+        if os.path.exists(video_only):
+            os.remove(video_only)
+    return output_path